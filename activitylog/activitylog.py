@@ -1,53 +1,129 @@
 import discord
 from discord.ext import commands
+from discord.utils import snowflake_time
 from cogs.utils import checks
 from cogs.utils.dataIO import dataIO
-from datetime import datetime, timedelta
+from cogs.utils.chat_formatting import box
+from datetime import datetime, timedelta, timezone
 import os
 import asyncio
 import aiohttp
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
 from enum import Enum
+import gzip
+import hashlib
+import json
+import logging
+import queue
+import re
+import shutil
+import sqlite3
+import threading
+import time
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-__version__ = '1.5.0'
+
+__version__ = '1.6.0'
+
+log = logging.getLogger('red.activitylog')
 
 TIMESTAMP_FORMAT = '%Y-%m-%d %X'  # YYYY-MM-DD HH:MM:SS
 PATH_LIST = ['data', 'activitylogger']
 PATH = os.path.join(*PATH_LIST)
 JSON = os.path.join(*PATH_LIST, "settings.json")
+BLOB_PATH = os.path.join(*PATH_LIST, "blobs")
+INDEX_PATH = os.path.join(*PATH_LIST, "index.sqlite")
+SEARCH_PAGE_SIZE = 10
+
+# Output formats: free-form text lines, or one JSON object per line
+LOG_FORMATS = {'text': '.log', 'jsonl': '.jsonl'}
+JSON_ENCODE = json.JSONEncoder(ensure_ascii=False, check_circular=False,
+                               separators=(',', ':')).encode
 EDIT_TIMEDELTA = timedelta(seconds=3)
-
-# 0 is Message object
-AUTHOR_TEMPLATE = "@{0.author.name}#{0.author.discriminator}"
-MESSAGE_TEMPLATE = AUTHOR_TEMPLATE + ": {0.clean_content}"
-
-# 0 is Message object, 1 is attachment URL
-ATTACHMENT_TEMPLATE = (AUTHOR_TEMPLATE + ": {0.clean_content} (attachment "
-                       "url(s): {1})")
-
-# 0 is Message object, 1 is attachment path
-# TODO: support multiple attachments?
-DOWNLOAD_TEMPLATE = (AUTHOR_TEMPLATE + ": {0.clean_content} (attachment "
-                     "saved to {1})")
-
-# 0 is before, 1 is after, 2 is formatted timestamp
-EDIT_TEMPLATE = (AUTHOR_TEMPLATE + " edited message from {2} "
-                 "({0.clean_content}) to read: {1.clean_content}")
-
-# 0 is deleted message, 1 is formatted timestamp
-DELETE_TEMPLATE = (AUTHOR_TEMPLATE + " deleted message from {1} "
-                   "({0.clean_content})")
+PROGRESS_WINDOW = 30  # seconds of samples used for fetch rates and ETAs
+CHECKPOINT_EXT = '.checkpoint'
+
+# Buffered entries are flushed at least this often (ms), or sooner once a
+# single file has this many characters waiting to be written.
+FLUSH_INTERVAL = 1000
+FLUSH_SIZE = 64 * 1024
+TAIL_SIZE = 64 * 1024  # bytes read back when looking for a log's last entry
+
+# Default number of logfile handles to keep open, and how often (seconds) the
+# open handles are checked for files that were deleted out from under them.
+HANDLE_LIMIT = 256
+SWEEP_INTERVAL = 60
+
+# Entries waiting for the writer thread. log() waits for room once it's full.
+# On unload, the writer gets this many seconds to finish before it's left be.
+WRITER_QUEUE_SIZE = 10000
+WRITER_STOP_TIMEOUT = 30
+
+# Number of channels fetched at once, and the history request budget that
+# all fetch workers share (requests per seconds).
+FETCH_WORKERS = 4
+FETCH_RATE = (5, 2)
+
+# Attachment downloads: concurrent workers, cap on bytes being downloaded at
+# once, read size, and retry count with exponential backoff base (seconds).
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_MAX_BYTES = 32 * 1024 * 1024
+DOWNLOAD_CHUNK = 64 * 1024
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 2
+DOWNLOAD_TIMEOUT = 600  # per attempt, including the wait for byte budget
+
+# Rotated segments are named <channel>.<SEGMENT_FORMAT>.log before compression,
+# with -2, -3... added when several are rotated within the same second
+SEGMENT_FORMAT = '%Y-%m-%d_%H%M%S'
+
+# Templates are filled in by the writer thread, so they only take strings and
+# datetimes copied out of discord objects, which can change after queueing.
+
+# 0 is author name#discriminator, 1 is content
+AUTHOR_TEMPLATE = "@{0}"
+MESSAGE_TEMPLATE = AUTHOR_TEMPLATE + ": {1}"
+
+# 0 is author, 1 is content, 2 is attachment URL
+ATTACHMENT_TEMPLATE = (AUTHOR_TEMPLATE + ": {1} (attachment "
+                       "url(s): {2})")
+
+# 0 is author, 1 is content, 2 is attachment path(s)
+DOWNLOAD_TEMPLATE = (AUTHOR_TEMPLATE + ": {1} (attachment "
+                     "saved to {2})")
+MULTI_DOWNLOAD_TEMPLATE = (AUTHOR_TEMPLATE + ": {1} (attachments "
+                           "saved to {2})")
+
+# 0 is author, 1 is content before, 2 is after, 3 is original timestamp
+EDIT_TEMPLATE = (AUTHOR_TEMPLATE + " edited message from {3:%s} "
+                 "({1}) to read: {2}" % TIMESTAMP_FORMAT)
+
+# 0 is author, 1 is deleted content, 2 is original timestamp
+DELETE_TEMPLATE = (AUTHOR_TEMPLATE + " deleted message from {2:%s} "
+                   "({1})" % TIMESTAMP_FORMAT)
 
 
 class FetchCookie(object):
-    def __init__(self, ctx, start, status_msg, last_edit=None):
+    def __init__(self, ctx, start, status_msg):
         self.ctx = ctx
         self.start = start
         self.status_msg = status_msg
-        self.last_edit = last_edit
         self.total_messages = 0
+        self.done_messages = 0
         self.completed_messages = []
+        self.active_lines = OrderedDict()  # id: [channel, count, last_msg, window]
+        self.pending_channels = []
+        self.samples = deque()
+        self.dirty = asyncio.Event()
+        self.reporter = None
+        self.finished = False
+        self.summary = None
 
 
 class FetchStatus(Enum):
@@ -58,27 +134,685 @@ class FetchStatus(Enum):
     COMPLETED = 'completed'
 
 
+class RateBudget:
+    """token bucket shared by concurrent fetch workers"""
+    def __init__(self, rate, per, loop):
+        self.rate = rate
+        self.per = per
+        self.loop = loop
+        self.tokens = rate
+        self.updated = loop.time()
+        self.lock = asyncio.Lock(loop=loop)
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = self.loop.time()
+                refill = (now - self.updated) * self.rate / self.per
+                self.tokens = min(self.rate, self.tokens + refill)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                delay = (1 - self.tokens) * self.per / self.rate
+                await asyncio.sleep(delay, loop=self.loop)
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadQueue:
+    """worker pool that streams attachments to disk in the background"""
+    def __init__(self, session, loop, workers=DOWNLOAD_WORKERS,
+                 max_bytes=DOWNLOAD_MAX_BYTES):
+        self.session = session
+        self.loop = loop
+        self.max_bytes = max_bytes
+        self.inflight = 0
+        self.inflight_cond = asyncio.Condition(loop=loop)
+        self.pending = set()
+        self.queue = asyncio.Queue(loop=loop)
+        self.tasks = [loop.create_task(self.worker()) for _ in range(workers)]
+
+    def put(self, aid, url, dl_path):
+        """Queues a download without waiting for it"""
+        if dl_path in self.pending:
+            return
+
+        self.pending.add(dl_path)
+        self.queue.put_nowait((aid, url, dl_path))
+
+    def cancel(self):
+        for t in self.tasks:
+            t.cancel()
+
+    async def worker(self):
+        while True:
+            aid, url, dl_path = await self.queue.get()
+            try:
+                await self.download(aid, url, dl_path)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('Error downloading %s to %s', url, dl_path)
+            finally:
+                self.pending.discard(dl_path)
+
+    async def download(self, aid, url, dl_path):
+        if os.path.exists(dl_path):  # don't redownload
+            return
+
+        for dirname in (os.path.dirname(dl_path), BLOB_PATH):
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+        for attempt in range(DOWNLOAD_RETRIES):
+            try:
+                blob = await asyncio.wait_for(
+                    self._download(url, os.path.join(BLOB_PATH, aid + '.tmp')),
+                    DOWNLOAD_TIMEOUT, loop=self.loop)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError) as e:
+                if attempt + 1 == DOWNLOAD_RETRIES:
+                    raise
+
+                delay = DOWNLOAD_BACKOFF * 2 ** attempt
+                log.warning('Download of %s failed (%s), retrying in %is',
+                            url, str(e) or type(e).__name__, delay)
+                await asyncio.sleep(delay, loop=self.loop)
+
+        self.link_blob(blob, dl_path)
+
+    async def _download(self, url, tmp_path):
+        """Streams url into the blob store, returning the blob's path"""
+        digest = hashlib.sha256()
+
+        async with self.session.get(url) as r:
+            if r.status != 200:
+                raise DownloadError('HTTP status %i' % r.status)
+
+            # huge files and ones of unknown length take the whole budget,
+            # so they stream alone
+            length = r.headers.get('Content-Length')
+            size = min(int(length), self.max_bytes) if length else self.max_bytes
+            await self._reserve(size)
+
+            try:
+                received = 0
+                with open(tmp_path, 'wb') as f:
+                    while True:
+                        chunk = await r.content.read(DOWNLOAD_CHUNK)
+                        if not chunk:
+                            break
+                        received += len(chunk)
+                        if size < self.max_bytes and received > size:
+                            raise DownloadError('body is longer than its '
+                                                'Content-Length')
+                        digest.update(chunk)
+                        f.write(chunk)
+
+                blob = self.blob_path(digest.hexdigest())
+
+                if os.path.exists(blob):  # already stored
+                    os.remove(tmp_path)
+                else:
+                    dirname, _ = os.path.split(blob)
+                    if not os.path.exists(dirname):
+                        os.makedirs(dirname)
+                    os.replace(tmp_path, blob)
+
+                return blob
+            finally:
+                await self._release(size)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    @staticmethod
+    def blob_path(hexdigest):
+        return os.path.join(BLOB_PATH, hexdigest[:2], hexdigest)
+
+    @staticmethod
+    def link_blob(blob, dl_path):
+        """Hardlinks a stored blob to its per-channel name, copying if needed"""
+        try:
+            os.link(blob, dl_path)
+        except FileExistsError:
+            pass
+        except OSError:  # no hardlink support, or a different filesystem
+            shutil.copyfile(blob, dl_path)
+
+    async def _reserve(self, size):
+        async with self.inflight_cond:
+            await self.inflight_cond.wait_for(
+                lambda: self.inflight + size <= self.max_bytes)
+            self.inflight += size
+
+    async def _release(self, size):
+        async with self.inflight_cond:
+            self.inflight -= size
+            self.inflight_cond.notify_all()
+
+
 class LogHandle:
-    """basic wrapper for logfile handles, used to keep track of stale handles"""
-    def __init__(self, path, time=None, mode='a', buf=1):
-        self.handle = open(path, mode, buf, errors='backslashreplace')
-        self.lock = asyncio.Lock()
+    """buffered wrapper for logfile handles
 
-        if time:
-            self.time = time
-        else:
-            self.time = datetime.fromtimestamp(os.path.getmtime(path))
+    Entries are collected in memory by write() and written out in bulk by
+    flush(). Only the writer thread uses these.
+    """
+    def __init__(self, path, mode='a', buf=-1):
+        self.path = path
+        self.handle = open(path, mode, buf, errors='backslashreplace')
+        self.buffer = []
+        self.buffered = 0
+
+        st = os.fstat(self.handle.fileno())
+        self.size = st.st_size
+        self.day = datetime.utcfromtimestamp(st.st_mtime).date()
+
+    def write(self, value):
+        """Queues value for the next flush, returning the buffered size"""
+        self.size += len(value)
+        self.buffer.append(value)
+        self.buffered += len(value)
+        return self.buffered
+
+    def flush(self):
+        if not self.buffer or self.handle.closed:
+            return
 
-    async def write(self, value):
-        async with self.lock:
-            self._write(value)
+        self.handle.write(''.join(self.buffer))
+        self.handle.flush()
+        self.buffer = []
+        self.buffered = 0
 
     def close(self):
+        self.flush()
         self.handle.close()
 
-    def _write(self, value):
-        self.time = datetime.utcnow()
-        self.handle.write(value)
+
+class HandlePool:
+    """LRU cache of open LogHandles, keyed by path"""
+    def __init__(self, capacity=HANDLE_LIMIT):
+        self.capacity = capacity
+        self.handles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __contains__(self, path):
+        return path in self.handles
+
+    def get(self, path, mode='a'):
+        handle = self.handles.get(path)
+
+        if handle is not None:
+            self.hits += 1
+            self.handles.move_to_end(path)
+            return handle
+
+        self.misses += 1
+        dirname, _ = os.path.split(path)
+
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        handle = LogHandle(path, mode=mode)
+        self.handles[path] = handle
+        self.trim()
+        return handle
+
+    def set_capacity(self, capacity):
+        self.capacity = capacity
+        self.trim()
+
+    def trim(self):
+        """Closes least recently used handles until within capacity"""
+        while len(self.handles) > self.capacity:
+            _, handle = self.handles.popitem(last=False)
+            handle.close()
+            self.evictions += 1
+
+    def detach(self, path):
+        """Removes a handle from the pool without closing it"""
+        return self.handles.pop(path, None)
+
+    def discard(self, path):
+        handle = self.handles.pop(path, None)
+        if handle is not None:
+            try:  # try to close, no guarantees tho
+                handle.close()
+            except Exception:
+                pass
+
+    def values(self):
+        return list(self.handles.values())
+
+    def close_all(self):
+        while self.handles:
+            path, handle = self.handles.popitem()
+            try:
+                handle.close()
+            except OSError:
+                log.exception('Error closing %s', path)
+
+    def find_stale(self):
+        """Returns paths of handles whose file was deleted since opening"""
+        stale = []
+        for h in self.values():
+            try:
+                if os.fstat(h.handle.fileno()).st_nlink == 0:
+                    stale.append(h.path)
+            except (OSError, ValueError):  # closed by an eviction
+                pass
+        return stale
+
+    def stats(self):
+        return {
+            'open'      : len(self.handles),
+            'capacity'  : self.capacity,
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'evictions' : self.evictions
+        }
+
+
+class LogIndex:
+    """SQLite index of logged entries, written in batches with the logs
+
+    Entries are queued by add() and inserted by flush(), both in the writer
+    thread; search() may run in any thread. Free-text matching uses FTS5 when
+    the sqlite library has it, or falls back to LIKE.
+    """
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()  # guards the connection
+        self.pending = []
+        self.fts = True
+
+        with self.lock:
+            self._setup()
+
+    def _setup(self):
+        c = self.conn
+        c.execute('PRAGMA journal_mode=WAL')
+        c.execute('CREATE TABLE IF NOT EXISTS entries ('
+                  'id INTEGER PRIMARY KEY, timestamp REAL NOT NULL, '
+                  'server TEXT, channel TEXT, author TEXT, subfolder TEXT, '
+                  'text TEXT NOT NULL)')
+        c.execute('CREATE INDEX IF NOT EXISTS entries_server '
+                  'ON entries (server, timestamp)')
+        c.execute('CREATE INDEX IF NOT EXISTS entries_channel '
+                  'ON entries (channel, timestamp)')
+        c.execute('CREATE INDEX IF NOT EXISTS entries_author '
+                  'ON entries (author, timestamp)')
+
+        try:
+            c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING "
+                      "fts5(text, content='entries', content_rowid='id')")
+        except sqlite3.OperationalError:  # built without FTS5
+            self.fts = False
+
+        c.commit()
+
+    def add(self, timestamp, server, channel, author, subfolder, text):
+        self.pending.append((timestamp, server, channel, author, subfolder, text))
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        rows = self.pending
+        self.pending = []
+
+        with self.lock:
+            c = self.conn
+            last_id = c.execute('SELECT IFNULL(MAX(id), 0) FROM entries').fetchone()[0]
+            c.executemany('INSERT INTO entries (timestamp, server, channel, '
+                          'author, subfolder, text) VALUES (?, ?, ?, ?, ?, ?)',
+                          rows)
+
+            if self.fts:
+                c.execute('INSERT INTO entries_fts (rowid, text) SELECT id, '
+                          'text FROM entries WHERE id > ?', (last_id,))
+
+            c.commit()
+
+    def remove_after(self, server, channel, subfolder, after):
+        """Deletes a channel's entries in subfolder newer than after"""
+        self.flush()
+        where = (' FROM entries WHERE server = ? AND channel = ? '
+                 'AND subfolder = ? AND timestamp > ?')
+        params = (server, channel, subfolder, after)
+
+        with self.lock:
+            c = self.conn
+            if self.fts:
+                c.execute("INSERT INTO entries_fts (entries_fts, rowid, text) "
+                          "SELECT 'delete', id, text" + where, params)
+            c.execute('DELETE' + where, params)
+            c.commit()
+
+    def search(self, server=None, channel=None, author=None, after=None,
+               before=None, text=None, limit=SEARCH_PAGE_SIZE, offset=0):
+        """Returns matching entries, newest first"""
+        clauses = []
+        params = []
+
+        for column, value in (('server', server), ('channel', channel),
+                              ('author', author)):
+            if value is not None:
+                clauses.append(column + ' = ?')
+                params.append(value)
+
+        if after is not None:
+            clauses.append('timestamp >= ?')
+            params.append(after)
+
+        if before is not None:
+            clauses.append('timestamp < ?')
+            params.append(before)
+
+        if text and self.fts:
+            clauses.append('id IN (SELECT rowid FROM entries_fts '
+                           'WHERE entries_fts MATCH ?)')
+            params.append('"%s"' % text.replace('"', '""'))
+        elif text:
+            clauses.append("text LIKE ? ESCAPE '\\'")
+            escaped = re.sub(r'([\\%_])', r'\\\1', text)
+            params.append('%' + escaped + '%')
+
+        query = ('SELECT timestamp, server, channel, author, subfolder, text '
+                 'FROM entries')
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?'
+        params += [limit, offset]
+
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+
+def compress_segment(path):
+    """Compresses a closed log segment with zstd if available, else gzip"""
+    if zstandard:
+        dest = path + '.zst'
+        with open(path, 'rb') as src, open(dest + '.tmp', 'wb') as dst:
+            zstandard.ZstdCompressor().copy_stream(src, dst)
+    else:
+        dest = path + '.gz'
+        with open(path, 'rb') as src, gzip.open(dest + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+    os.replace(dest + '.tmp', dest)
+    os.remove(path)
+    return dest
+
+
+class LogWriter(threading.Thread):
+    """Dedicated thread that formats log entries and owns all logfile I/O
+
+    The event loop only enqueues (function, args, future) tuples, usually
+    write_entry() with the raw pieces of an entry. Anything else that touches
+    the handle pool or index is also run here, via ActivityLogger.writer_call.
+    """
+    STOP = object()
+
+    def __init__(self, settings, handles, maxsize=WRITER_QUEUE_SIZE):
+        super().__init__(name='activitylog-writer', daemon=True)
+        self.settings = settings
+        self.handles = handles
+        self.index = LogIndex(INDEX_PATH) if settings.get('index') else None
+        self.queue = queue.Queue(maxsize)
+        self.compress_executor = ThreadPoolExecutor(max_workers=1)
+        self.high_water = 0
+        self.written = 0
+
+    @property
+    def flush_interval(self):
+        return self.settings.get('flush_interval', FLUSH_INTERVAL) / 1000
+
+    def stats(self):
+        return {
+            'queue_depth'      : self.queue.qsize(),
+            'queue_size'       : self.queue.maxsize,
+            'queue_high_water' : self.high_water,
+            'written'          : self.written
+        }
+
+    def put(self, item):
+        """Queues an item, waiting while the queue is full.
+
+        Raises RuntimeError instead of waiting forever if the thread is gone.
+        """
+        while True:
+            if not self.is_alive():
+                raise RuntimeError('activitylog writer thread is not running')
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def stop(self, timeout=WRITER_STOP_TIMEOUT):
+        """Writes out everything queued, then closes all files"""
+        if not self.is_alive():
+            return
+
+        try:
+            self.queue.put(self.STOP, timeout=timeout)
+        except queue.Full:
+            log.error('activitylog writer is stuck, not waiting for it to stop')
+            return
+
+        self.join(timeout)
+        if self.is_alive():
+            log.error('activitylog writer did not finish within %ss', timeout)
+
+    def run(self):
+        now = time.monotonic()
+        next_flush = now + self.flush_interval
+        next_sweep = now + SWEEP_INTERVAL
+
+        while True:
+            try:
+                item = self.queue.get(timeout=max(next_flush - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+
+            if item is self.STOP:
+                break
+            elif item is not None:
+                self.high_water = max(self.high_water, self.queue.qsize() + 1)
+                self.process(item)
+
+            now = time.monotonic()
+            if now >= next_flush:
+                next_flush = now + self.flush_interval
+                try:
+                    self.flush_all()
+
+                    if now >= next_sweep:
+                        next_sweep = now + SWEEP_INTERVAL
+                        for path in self.handles.find_stale():  # file was deleted?
+                            self.handles.discard(path)
+                except Exception:
+                    log.exception('Error flushing activitylog files')
+
+        try:
+            self.handles.close_all()
+            if self.index:
+                self.index.close()
+        except Exception:
+            log.exception('Error closing activitylog files')
+        finally:
+            self.compress_executor.shutdown(wait=True)
+
+    def process(self, item):
+        func, args, future = item
+        try:
+            result = func(*args)
+        except Exception as e:
+            if future is None:
+                log.exception('Error in activitylog writer')
+            else:
+                future.set_exception(e)
+        else:
+            if future is not None:
+                future.set_result(result)
+
+    def flush_all(self):
+        for h in self.handles.values():
+            try:
+                h.flush()
+            except OSError:  # keep flushing the others; retried next time
+                log.exception('Error flushing %s', h.path)
+
+        if self.index:
+            self.index.flush()
+
+    def flush_path(self, path):
+        """Flushes buffered entries for path, returning the file's size"""
+        handle = self.handles.handles.get(path)
+        if handle is not None:
+            handle.flush()
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def last_timestamp(self, path, jsonl=False):
+        """Returns the time of the last complete entry in path, or None"""
+        if not self.flush_path(path):
+            return None
+
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - TAIL_SIZE))
+            lines = f.read().splitlines()
+
+        # the first line may be cut off, and the last one partly written
+        for line in reversed(lines):
+            line = line.decode('utf-8', 'replace')
+            try:
+                if jsonl:
+                    return datetime.utcfromtimestamp(json.loads(line)['ts'])
+                else:
+                    return datetime.strptime(line[:19], TIMESTAMP_FORMAT)
+            except (ValueError, KeyError, TypeError):
+                continue
+
+    def truncate(self, path, size, checkpoint=None, subfolder=None):
+        """Closes path if open, and cuts the file down to size bytes.
+
+        Given the fetch checkpoint that size came from, also unindexes the
+        entries after it, which are about to be fetched again."""
+        self.handles.discard(path)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+        if self.index and checkpoint and checkpoint.get('last_timestamp') is not None:
+            self.index.remove_after(checkpoint['server'], checkpoint['channel'],
+                                    subfolder, checkpoint['last_timestamp'])
+
+    def set_index(self, enabled):
+        if enabled and not self.index:
+            self.index = LogIndex(INDEX_PATH)
+        elif self.index and not enabled:
+            self.index.close()
+            self.index = None
+
+    def write_entries(self, fname, mode, timestamp, texts, template_args, ids,
+                      channel_name, author, event, fields, subfolder, jsonl):
+        """Formats entries for one location and writes them in one call"""
+        epoch = timestamp.replace(tzinfo=timezone.utc).timestamp()
+        serverid, channelid = ids
+        lines = []
+
+        if jsonl:
+            base = {'ts': epoch, 'event': event or 'event', 'server': serverid}
+
+            if channelid:
+                base['channel'] = channelid
+                base['channel_name'] = channel_name
+            if author:
+                base['author'] = author
+            if fields:
+                base.update(fields)
+        else:
+            prefix = timestamp.strftime(TIMESTAMP_FORMAT) + ' '
+            if channel_name:
+                prefix += '#' + channel_name + ' '
+
+        for text in texts:
+            if template_args:
+                text = text.format(*template_args)
+
+            if jsonl:
+                record = base.copy()
+                record['text'] = text
+                lines.append(JSON_ENCODE(record) + '\n')
+                text = text.replace('\n', '\\n')
+            else:
+                text = text.replace('\n', '\\n')
+                lines.append(prefix + text + '\n')
+
+            if self.index:
+                self.index.add(epoch, serverid, channelid, author, subfolder, text)
+
+        handle = self.handles.get(fname, mode)
+        if not subfolder and self.should_rotate(handle):
+            handle = self.rotate(fname, mode=mode)
+
+        if handle.write(''.join(lines)) >= FLUSH_SIZE:
+            handle.flush()
+
+        self.written += len(lines)
+
+    def should_rotate(self, handle):
+        rotate = self.settings.get('rotate')
+
+        if not (rotate and handle.size):
+            return False
+        elif rotate == 'daily':
+            return handle.day != datetime.utcnow().date()
+        else:
+            return handle.size >= rotate * 1024 * 1024
+
+    def rotate(self, path, mode='a'):
+        """Closes the current segment of path and returns a fresh handle.
+
+        The closed segment is compressed in the background."""
+        handle = self.handles.detach(path)
+        if handle is not None:
+            handle.close()
+
+        base, ext = os.path.splitext(path)
+        suffix = datetime.utcnow().strftime(SEGMENT_FORMAT)
+        segment = '%s.%s%s' % (base, suffix, ext)
+        n = 1
+
+        while any(os.path.exists(segment + c) for c in ('', '.gz', '.zst')):
+            n += 1
+            segment = '%s.%s-%i%s' % (base, suffix, n, ext)
+
+        os.rename(path, segment)
+
+        future = self.compress_executor.submit(compress_segment, segment)
+        future.add_done_callback(partial(self.compress_done, segment))
+        return self.handles.get(path, mode)
+
+    @staticmethod
+    def compress_done(segment, future):
+        if future.exception() is not None:
+            log.error('Error compressing %s', segment, exc_info=future.exception())
 
 
 class ActivityLogger(object):
@@ -87,21 +821,54 @@ class ActivityLogger(object):
     def __init__(self, bot):
         self.bot = bot
         self.settings = dataIO.load_json(JSON)
-        self.handles = {}
+        self.decisions = {}  # (type, id) -> should_log result
+        self.handles = HandlePool(self.settings.get('handle_limit', HANDLE_LIMIT))
         self.lock = False
         self.session = aiohttp.ClientSession(loop=self.bot.loop)
+        self.downloads = DownloadQueue(self.session, self.bot.loop)
         self.fetch_handle = None
+        self.writer = LogWriter(self.settings, self.handles)
+        self.writer_lock = asyncio.Lock(loop=self.bot.loop)
+        self.writer.start()
 
     def __unload(self):
         self.lock = True
+        self.downloads.cancel()
         self.session.close()
-        for h in self.handles.values():
-            h.close()
+        self.writer.stop()
 
         if isinstance(self.fetch_handle, asyncio.Future):
             if not self.fetch_handle.cancelled():
                 self.fetch_handle.cancel()
 
+    @property
+    def index(self):
+        return self.writer.index
+
+    async def submit(self, item):
+        """Queues an item for the writer thread, waiting while it's full"""
+        if not self.writer_lock.locked() and self.writer.is_alive():
+            try:
+                self.writer.queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+
+        async with self.writer_lock:  # keeps waiting entries in order
+            await self.bot.loop.run_in_executor(None, self.writer.put, item)
+
+    async def writer_call(self, func, *args):
+        """Runs func in the writer thread and returns its result"""
+        future = Future()
+        await self.submit((func, args, future))
+        return await asyncio.wrap_future(future, loop=self.bot.loop)
+
+    def get_stats(self):
+        """Writer queue and handle cache counters, for monitoring"""
+        stats = self.writer.stats()
+        stats.update(('handles_' + k, v) for k, v in self.handles.stats().items())
+        return stats
+
     async def _robust_edit(self, msg, content=None, embed=None):
         try:
             msg = await self.bot.edit_message(msg, new_content=content, embed=embed)
@@ -114,10 +881,91 @@ class ActivityLogger(object):
     async def cookie_edit_task(self, cookie, **kwargs):
         cookie.status_msg = await self._robust_edit(cookie.status_msg, **kwargs)
 
-    async def fetch_task(self, channels, subfolder, attachments=None, status_cb=None):
-        channel = None
+    async def save_checkpoint(self, channel, subfolder, last_msg=None, completed=False,
+                              end=None):
+        """Records how far a fetch got, and where it stops, after flushing what
+        it wrote."""
+        path = self.log_path(channel, subfolder)
+        offset = await self.writer_call(self.writer.flush_path, path)
+
+        if type(last_msg) is discord.Message:
+            last_id = last_msg.id
+            last_ts = last_msg.timestamp.replace(tzinfo=timezone.utc).timestamp()
+        elif type(last_msg) is datetime:
+            last_id = None
+            last_ts = last_msg.replace(tzinfo=timezone.utc).timestamp()
+        elif last_msg is not None:
+            last_id = last_msg.id
+            last_ts = snowflake_time(last_id).replace(tzinfo=timezone.utc).timestamp()
+        else:
+            last_id = last_ts = None
+
+        data = {
+            'server'         : channel.server.id,
+            'channel'        : channel.id,
+            'last_id'        : last_id,
+            'last_timestamp' : last_ts,
+            'offset'         : offset,
+            'completed'      : completed,
+            'end'            : end and end.replace(tzinfo=timezone.utc).timestamp()
+        }
+
+        dirname, _ = os.path.split(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        dataIO.save_json(self.get_path(channel, subfolder, CHECKPOINT_EXT), data)
+
+    @staticmethod
+    def find_checkpoints(subfolder):
+        for serverid in os.listdir(PATH):
+            folder = os.path.join(PATH, serverid, str(subfolder))
+            if not os.path.isdir(folder):
+                continue
+
+            for fname in os.listdir(folder):
+                if fname.endswith(CHECKPOINT_EXT):
+                    yield dataIO.load_json(os.path.join(folder, fname))
+
+    async def incremental_begin(self, channels, subfolder):
+        """Finds where the last fetch of each channel into subfolder ended.
+
+        Uses the channel's checkpoint if it has a message ID, otherwise the
+        time of the last entry in its log. Entries from that last second may
+        be fetched again in the latter case.
+        """
+        checkpoints = {c['channel']: c for c in self.find_checkpoints(subfolder)}
+        begin = {}
+
+        for channel in channels:
+            checkpoint = checkpoints.get(channel.id, {})
+            path = self.log_path(channel, subfolder)
+
+            if checkpoint and not checkpoint.get('completed'):
+                await self.writer_call(self.writer.truncate, path, checkpoint['offset'],
+                                       checkpoint, subfolder)
+
+            if checkpoint.get('last_id'):
+                begin[channel.id] = discord.Object(id=checkpoint['last_id'])
+                continue
+
+            jsonl = self.get_format(channel) == 'jsonl'
+            last = await self.writer_call(self.writer.last_timestamp, path, jsonl)
+
+            if last is None and checkpoint.get('last_timestamp'):
+                last = datetime.utcfromtimestamp(checkpoint['last_timestamp'])
+
+            if last is not None:
+                begin[channel.id] = last
+
+        return begin
+
+    async def fetch_task(self, channels, subfolder, attachments=None, status_cb=None,
+                         workers=FETCH_WORKERS, begin=None, end=None):
         completed_channels = []
+        active_channels = []
         pending_channels = channels.copy()
+        budget = RateBudget(*FETCH_RATE, loop=self.bot.loop)
 
         def update(count, last_msg, status, channel, exception=None):
             if not callable(status_cb):
@@ -128,21 +976,32 @@ class ActivityLogger(object):
             status_cb(count=count, channel=channel, subfolder=subfolder,
                       status=status, exception=exception, last_msg=last_msg,
                       completed_channels=completed_channels,
+                      active_channels=active_channels,
                       pending_channels=pending_channels)
 
-        try:
-            for channel in channels:
-                pending_channels.remove(channel)
-                count = 0
-                fetch_begin = channel.created_at
+        def channel_range(channel):
+            return ((begin or {}).get(channel.id) or channel.created_at,
+                    (end or {}).get(channel.id))
+
+        async def fetch_one(channel):
+            count = 0
+            fetch_begin, fetch_end = channel_range(channel)
 
+            try:
                 update(count, None, FetchStatus.STARTING, channel)
+                await self.save_checkpoint(channel, subfolder, fetch_begin, end=fetch_end)
 
                 while True:
                     last_count = count
+                    past_end = False
+                    await budget.acquire()
+
                     async for message in self.bot.logs_from(channel,
                                                             after=fetch_begin,
                                                             reverse=True):
+                        if fetch_end and message.timestamp >= fetch_end:
+                            past_end = True
+                            break
 
                         await self.message_handler(message, force=True,
                                                    subfolder=subfolder,
@@ -152,21 +1011,61 @@ class ActivityLogger(object):
                         update(count, fetch_begin, FetchStatus.FETCHING, channel)
                         count += 1
 
-                    if count == last_count:
+                    if past_end or count == last_count:
                         break
 
-                update(count, fetch_begin, FetchStatus.COMPLETED, channel)
-                completed_channels.append(channel)
+                    await self.save_checkpoint(channel, subfolder, fetch_begin,
+                                               end=fetch_end)
+
+                await self.save_checkpoint(channel, subfolder, fetch_begin,
+                                           completed=True, end=fetch_end)
 
+            except asyncio.CancelledError:
+                active_channels.remove(channel)
+                update(count, fetch_begin, FetchStatus.CANCELLED, channel)
+                raise
+            except Exception as e:
+                active_channels.remove(channel)
+                update(count, fetch_begin, FetchStatus.EXCEPTION, channel, exception=e)
+                raise
+
+            active_channels.remove(channel)
+            completed_channels.append(channel)
+            update(count, fetch_begin, FetchStatus.COMPLETED, channel)
+
+        async def worker():
+            while pending_channels:
+                channel = pending_channels.pop(0)
+                active_channels.append(channel)
+                await fetch_one(channel)
+
+        if not channels:  # asyncio.wait() rejects an empty set
+            return
+
+        # checkpoint every channel up front, so logfetch resume also finishes
+        # the ones that were still pending if the fetch stops early
+        for channel in channels:
+            fetch_begin, fetch_end = channel_range(channel)
+            await self.save_checkpoint(channel, subfolder, fetch_begin, end=fetch_end)
+
+        tasks = [self.bot.loop.create_task(worker())
+                 for _ in range(min(workers, len(channels)))]
+
+        try:
+            done, _ = await asyncio.wait(tasks, loop=self.bot.loop,
+                                         return_when=asyncio.FIRST_EXCEPTION)
         except asyncio.CancelledError:
-            update(count, fetch_begin, FetchStatus.CANCELLED, channel)
-        except Exception as e:
-            update(count, fetch_begin, FetchStatus.EXCEPTION, channel, exception=e)
-            raise
+            return
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+        for t in done:
+            if not t.cancelled() and t.exception():
+                raise t.exception()
 
     def format_fetch_line(self, cookie, count, status, exception, channel, **kwargs):
-        elapsed = datetime.now() - (cookie.last_edit or cookie.start)
-        edit_to = None
         base = '#%s: ' % channel.name
 
         if status is FetchStatus.STARTING:
@@ -182,33 +1081,122 @@ class ActivityLogger(object):
         elif status is FetchStatus.COMPLETED:
             edit_to = base + 'fetched %i messages.' % count
         elif status is FetchStatus.FETCHING:
-            if elapsed > EDIT_TIMEDELTA:
-                edit_to = base + '%i messages retrieved so far...' % count
+            edit_to = base + '%i messages retrieved so far...' % count
 
         return edit_to
 
-    def fetch_callback(self, cookie, pending_channels, **kwargs):
-        status = kwargs.get('status')
-        count = kwargs.get('count')
+    @staticmethod
+    def sample_window(window, now, *values):
+        """Adds a sample and returns the per-second rates over the window"""
+        window.append((now,) + values)
+        while now - window[0][0] > PROGRESS_WINDOW and len(window) > 2:
+            window.popleft()
+
+        elapsed = now - window[0][0]
+        if not elapsed:
+            return [None] * len(values)
+
+        return [(v - v0) / elapsed for v, v0 in zip(values, window[0][1:])]
+
+    def render_fetch_status(self, cookie):
+        now = time.monotonic()
+        utcnow = datetime.utcnow()
+        rows = list(cookie.completed_messages)
+
+        for channel, count, last_msg, window in cookie.active_lines.values():
+            if last_msg is None:
+                rows.append('#%s: initializing...' % channel.name)
+                continue
+
+            # how far through the channel's history this fetch is, by time
+            span = (utcnow - channel.created_at).total_seconds()
+            done = (last_msg.timestamp - channel.created_at).total_seconds()
+            progress = min(done / span, 1) if span > 0 else 1
+
+            rate, progress_rate = self.sample_window(window, now, count, progress)
+            line = '#%s: %i messages retrieved so far' % (channel.name, count)
+
+            if rate:
+                line += ' (%.1f/s' % rate
+                if progress_rate:
+                    eta = timedelta(seconds=int((1 - progress) / progress_rate))
+                    line += ', ETA %s' % eta
+                line += ')'
+
+            rows.append(line + '...')
 
-        format_line = self.format_fetch_line(cookie, **kwargs)
-        if format_line:
-            rows = cookie.completed_messages + [format_line]
-            rows.extend([('#%s: pending' % c.name) for c in pending_channels])
-            cookie.last_edit = datetime.now()
-            task = self.cookie_edit_task(cookie, content='\n'.join(rows))
-            self.bot.loop.create_task(task)
+        rows.extend([('#%s: pending' % c.name) for c in cookie.pending_channels])
 
-        if status is FetchStatus.COMPLETED:
-            cookie.total_messages += count
-            cookie.completed_messages.append(format_line)
+        if cookie.active_lines:
+            total = cookie.done_messages + sum(v[1] for v in cookie.active_lines.values())
+            rate, = self.sample_window(cookie.samples, now, total)
+            if rate is not None:
+                rows.append('Overall: %.1f messages/s' % rate)
 
-            if not pending_channels:
-                dest = cookie.ctx.message.channel
+        return '\n'.join(rows)
+
+    async def fetch_reporter(self, cookie):
+        """Coalesces fetch progress into at most one status edit at a time.
+
+        Each edit shows the latest state. The pause between edits grows with
+        how long the last one took, so a rate-limited channel gets fewer.
+        """
+        interval = EDIT_TIMEDELTA.total_seconds()
+
+        while True:
+            await cookie.dirty.wait()
+            cookie.dirty.clear()
+            finished = cookie.finished
+            started = time.monotonic()
+
+            try:
+                await self.cookie_edit_task(cookie, content=self.render_fetch_status(cookie))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('Error updating fetch status')
+
+            if finished:
+                break
+
+            await asyncio.sleep(max(interval, 2 * (time.monotonic() - started)))
+
+        if cookie.summary:
+            await self.bot.send_message(cookie.ctx.message.channel, cookie.summary)
+
+    def fetch_callback(self, cookie, pending_channels, active_channels, **kwargs):
+        status = kwargs.get('status')
+        count = kwargs.get('count')
+        channel = kwargs.get('channel')
+
+        if status is FetchStatus.FETCHING:
+            # runs for every message, so only record the latest state here
+            line = cookie.active_lines[channel.id]
+            line[1] = count
+            line[2] = kwargs.get('last_msg')
+        elif status is FetchStatus.STARTING:
+            cookie.active_lines[channel.id] = [channel, count, None, deque()]
+        else:  # the channel is done, one way or another
+            cookie.active_lines.pop(channel.id, None)
+            cookie.completed_messages.append(self.format_fetch_line(cookie, **kwargs))
+            cookie.done_messages += count
+
+            if status is FetchStatus.COMPLETED:
+                cookie.total_messages += count
+
+            if not active_channels and status is not FetchStatus.COMPLETED:
+                cookie.finished = True  # cancelled or failed
+            elif not (active_channels or pending_channels):
                 elapsed = datetime.now() - cookie.start
-                msg = ('Fetched a total of %i messages in %s.'
-                       % (cookie.total_messages, elapsed))
-                self.bot.loop.create_task(self.bot.send_message(dest, msg))
+                cookie.summary = ('Fetched a total of %i messages in %s.'
+                                  % (cookie.total_messages, elapsed))
+                cookie.finished = True
+
+        cookie.pending_channels = pending_channels
+        cookie.dirty.set()
+
+        if cookie.reporter is None:
+            cookie.reporter = self.bot.loop.create_task(self.fetch_reporter(cookie))
 
     @commands.group(pass_context=True)
     @checks.is_owner()
@@ -217,6 +1205,49 @@ class ActivityLogger(object):
         if ctx.invoked_subcommand is None:
             await self.bot.send_cmd_help(ctx)
 
+    async def dispatch_fetch(self, ctx, channels, subfolder, attachments=None,
+                             after=None, before=None, begin=None, end=None):
+        """Starts a fetch task. after may be a time or 'last', see logfetch.
+
+        begin and end may instead give each channel's range, keyed by ID.
+        """
+        if not channels:
+            await self.bot.say('There are no channels I can fetch logs from.')
+            return
+
+        try:
+            if before:
+                before = self._parse_fetch_time(before)
+                end = {c.id: before for c in channels}
+
+            if after == 'last':
+                begin = await self.incremental_begin(channels, subfolder)
+            elif after:
+                after = self._parse_fetch_time(after)
+                begin = {c.id: after for c in channels}
+        except ValueError as e:
+            await self.bot.say('Invalid time: %s' % e)
+            return
+
+        msg = await self.bot.say('Dispatching fetch task...')
+        cookie = FetchCookie(ctx, datetime.now(), msg)
+
+        callback = partial(self.fetch_callback, cookie)
+        task = self.fetch_task(channels, subfolder, attachments=attachments,
+                               status_cb=callback, begin=begin, end=end)
+
+        self.fetch_handle = self.bot.loop.create_task(task)
+
+    @staticmethod
+    def _parse_fetch_time(value):
+        for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S'):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+
+        raise ValueError("%s isn't YYYY-MM-DD[THH:MM[:SS]] (UTC)" % value)
+
     @logfetch.command(pass_context=True, name='cancel')
     async def fetch_cancel(self, ctx):
         "Cancels a running fetch operation."
@@ -229,30 +1260,75 @@ class ActivityLogger(object):
 
         await self.bot.say('Nothing to cancel.')
 
-    @logfetch.command(pass_context=True, name='channel')
-    async def fetch_channel(self, ctx, subfolder: str, channel: discord.Channel = None, attachments: bool = None):
-        "Fetch complete logs for a channel. Defaults to the current one."
+    @logfetch.command(pass_context=True, name='resume')
+    async def fetch_resume(self, ctx, subfolder: str, attachments: bool = None):
+        """Resumes interrupted fetches into subfolder from their checkpoints.
 
-        msg = await self.bot.say('Dispatching fetch task...')
-        start = datetime.now()
+        Anything written after a channel's last checkpoint is discarded and
+        fetched again, so no lines are duplicated.
+        """
+        if isinstance(self.fetch_handle, asyncio.Future):
+            if not self.fetch_handle.done():
+                await self.bot.say('A fetch is already running.')
+                return
+
+        channels = []
+        begin = {}
+        end = {}
+
+        for checkpoint in self.find_checkpoints(subfolder):
+            if checkpoint.get('completed'):
+                continue
+
+            channel = self.bot.get_channel(checkpoint['channel'])
+            if channel is None:
+                continue
+
+            path = self.log_path(channel, subfolder)
+            await self.writer_call(self.writer.truncate, path, checkpoint['offset'],
+                                   checkpoint, subfolder)
+
+            # like incremental_begin, but the checkpoint's time is where the
+            # fetch began if it was interrupted before its first page
+            if checkpoint['last_id']:
+                begin[channel.id] = discord.Object(id=checkpoint['last_id'])
+            elif checkpoint.get('last_timestamp'):
+                begin[channel.id] = datetime.utcfromtimestamp(checkpoint['last_timestamp'])
+
+            if checkpoint.get('end'):
+                end[channel.id] = datetime.utcfromtimestamp(checkpoint['end'])
 
-        cookie = FetchCookie(ctx, start, msg)
+            channels.append(channel)
+
+        if not channels:
+            await self.bot.say('Nothing to resume in that subfolder.')
+            return
+
+        await self.dispatch_fetch(ctx, channels, subfolder, attachments,
+                                  begin=begin, end=end)
+
+    @logfetch.command(pass_context=True, name='channel')
+    async def fetch_channel(self, ctx, subfolder: str, channel: discord.Channel = None,
+                            attachments: bool = None, after: str = None, before: str = None):
+        """Fetch complete logs for a channel. Defaults to the current one.
 
+        after and before limit the fetch to a time range, as YYYY-MM-DD or
+        YYYY-MM-DDTHH:MM[:SS] in UTC. If after is "last", only messages newer
+        than what is already in the subfolder are fetched.
+        """
         if channel is None:
             channel = ctx.message.channel
 
-        callback = partial(self.fetch_callback, cookie)
-        task = self.fetch_task([channel], subfolder, attachments=attachments,
-                               status_cb=callback)
-
-        self.fetch_handle = self.bot.loop.create_task(task)
+        await self.dispatch_fetch(ctx, [channel], subfolder, attachments, after, before)
 
     @logfetch.command(pass_context=True, name='server', allow_dm=False)
-    async def fetch_server(self, ctx, subfolder: str, attachments: bool = None):
+    async def fetch_server(self, ctx, subfolder: str, attachments: bool = None,
+                           after: str = None, before: str = None):
         """Fetch complete logs for the current server.
 
         Respects current logging settings such as attachments and channels.
         Note that server events such as join/leave, ban etc can't be retrieved.
+        See logfetch channel for after and before.
         """
         server = ctx.message.server
 
@@ -262,27 +1338,15 @@ class ActivityLogger(object):
             return channel.permissions_for(server.me).read_message_history
 
         channels = [c for c in server.channels if check(c)]
-
-        msg = await self.bot.say('Dispatching fetch task...')
-        start = datetime.now()
-
-        cookie = FetchCookie(ctx, start, msg)
-
-        callback = partial(self.fetch_callback, cookie)
-        task = self.fetch_task(channels, subfolder, attachments=attachments,
-                               status_cb=callback)
-
-        self.fetch_handle = self.bot.loop.create_task(task)
+        await self.dispatch_fetch(ctx, channels, subfolder, attachments, after, before)
 
     @logfetch.command(pass_context=True, name='remote-channel')
-    async def fetch_rchannel(self, ctx, subfolder: str, channel_id: str, attachments: bool = None):
-        "Fetch complete logs for any channel the bot can see."
-
-        msg = await self.bot.say('Dispatching fetch task...')
-        start = datetime.now()
-
-        cookie = FetchCookie(ctx, start, msg)
+    async def fetch_rchannel(self, ctx, subfolder: str, channel_id: str, attachments: bool = None,
+                             after: str = None, before: str = None):
+        """Fetch complete logs for any channel the bot can see.
 
+        See logfetch channel for after and before.
+        """
         channel = self.bot.get_channel(channel_id)
         if not channel:
             await self.bot.say('Could not find that server.')
@@ -292,18 +1356,16 @@ class ActivityLogger(object):
                                'in that channel.')
             return
 
-        callback = partial(self.fetch_callback, cookie)
-        task = self.fetch_task([channel], subfolder, attachments=attachments,
-                               status_cb=callback)
-
-        self.fetch_handle = self.bot.loop.create_task(task)
+        await self.dispatch_fetch(ctx, [channel], subfolder, attachments, after, before)
 
     @logfetch.command(pass_context=True, name='remote-server')
-    async def fetch_rserver(self, ctx, subfolder: str, server_id: str, attachments: bool = None):
+    async def fetch_rserver(self, ctx, subfolder: str, server_id: str, attachments: bool = None,
+                            after: str = None, before: str = None):
         """Fetch complete logs for another server.
 
         Respects current logging settings such as attachments and channels.
         Note that server events such as join/leave, ban etc can't be retrieved.
+        See logfetch channel for after and before.
         """
 
         server = self.bot.get_server(server_id)
@@ -317,17 +1379,86 @@ class ActivityLogger(object):
             return channel.permissions_for(server.me).read_message_history
 
         channels = [c for c in server.channels if check(c)]
+        await self.dispatch_fetch(ctx, channels, subfolder, attachments, after, before)
 
-        msg = await self.bot.say('Dispatching fetch task...')
-        start = datetime.now()
+    @commands.command(pass_context=True)
+    @checks.is_owner()
+    async def logsearch(self, ctx, *, query: str = ''):
+        """Searches indexed logs, newest first.
 
-        cookie = FetchCookie(ctx, start, msg)
+        Filters go before the search text, any of:
+        server:<id>, channel:<#channel|id>, user:<@user|id>,
+        after:<YYYY-MM-DD|unix time>, before:<YYYY-MM-DD|unix time>, page:<n>
 
-        callback = partial(self.fetch_callback, cookie)
-        task = self.fetch_task(channels, subfolder, attachments=attachments,
-                               status_cb=callback)
+        Within a server, the current server is searched unless server:any or
+        another server is given.
+        """
+        if not self.index:
+            await self.bot.say('Search indexing is disabled. Enable it with '
+                               '`%slogset index on`.' % ctx.prefix)
+            return
 
-        self.fetch_handle = self.bot.loop.create_task(task)
+        server = ctx.message.server
+        filters = {'server': server.id if server else None}
+        page = 1
+        words = query.split()
+
+        try:
+            while words and ':' in words[0]:
+                key, value = words.pop(0).split(':', 1)
+                key = key.lower()
+
+                if key == 'page':
+                    page = max(int(value), 1)
+                elif key == 'server':
+                    filters['server'] = None if value == 'any' else value
+                elif key in ('channel', 'user'):
+                    value = value.strip('<#@!>')
+                    if not value.isdigit():
+                        raise ValueError('%s must be a mention or ID' % key)
+                    filters['channel' if key == 'channel' else 'author'] = value
+                elif key in ('after', 'before'):
+                    filters[key] = self._parse_search_time(value)
+                else:
+                    words.insert(0, key + ':' + value)
+                    break
+        except ValueError as e:
+            await self.bot.say('Invalid filter: %s' % e)
+            return
+
+        filters['text'] = ' '.join(words) or None
+        offset = (page - 1) * SEARCH_PAGE_SIZE
+        search = partial(self.index.search, limit=SEARCH_PAGE_SIZE + 1,
+                         offset=offset, **filters)
+        rows = await self.bot.loop.run_in_executor(None, search)
+
+        if not rows:
+            await self.bot.say('No results.')
+            return
+
+        lines = []
+        for timestamp, _, channelid, _, subfolder, text in rows[:SEARCH_PAGE_SIZE]:
+            ts = datetime.utcfromtimestamp(timestamp).strftime(TIMESTAMP_FORMAT)
+            channel = channelid and self.bot.get_channel(channelid)
+            where = ('#' + channel.name) if channel else (channelid or 'server')
+            if subfolder:
+                where += ' [%s]' % subfolder
+            line = '%s %s %s' % (ts, where, text)
+            lines.append(line if len(line) <= 180 else line[:177] + '...')
+
+        footer = 'Page %i' % page
+        if len(rows) > SEARCH_PAGE_SIZE:
+            footer += ', more results with page:%i' % (page + 1)
+
+        await self.bot.say(box('\n'.join(lines)) + footer)
+
+    @staticmethod
+    def _parse_search_time(value):
+        if value.replace('.', '', 1).isdigit():
+            return float(value)
+
+        ts = datetime.strptime(value, '%Y-%m-%d')
+        return ts.replace(tzinfo=timezone.utc).timestamp()
 
     @commands.group(pass_context=True)
     @checks.is_owner()
@@ -450,7 +1581,117 @@ class ActivityLogger(object):
             await self.bot.say('Logging disabled for server events in %s' % server)
         self.save_json()
 
+    @logset.command(name='flush')
+    async def set_flush(self, interval_ms: int = None):
+        """Sets the maximum time (in ms) log entries are held before writing.
+
+        Lower values are more durable, higher values mean fewer disk writes."""
+        if interval_ms is not None:
+            if interval_ms < 10:
+                await self.bot.say('The flush interval must be at least 10ms.')
+                return
+            self.settings['flush_interval'] = interval_ms
+            self.save_json()
+
+        await self.bot.say('Log entries are flushed to disk at least every '
+                           '%ims.' % (self.writer.flush_interval * 1000))
+
+    @logset.command(name='stats')
+    async def set_stats(self):
+        """Shows writer queue and logfile handle statistics."""
+        stats = self.get_stats()
+        await self.bot.say(box('\n'.join('%s: %s' % kv for kv in sorted(stats.items()))))
+
+    @logset.command(name='handles')
+    async def set_handles(self, capacity: int = None):
+        """Sets how many logfiles may be open at once, and shows cache stats."""
+        if capacity is not None:
+            if capacity < 1:
+                await self.bot.say('The handle limit must be at least 1.')
+                return
+            self.settings['handle_limit'] = capacity
+            await self.writer_call(self.handles.set_capacity, capacity)
+            self.save_json()
+
+        stats = self.handles.stats()
+        await self.bot.say('{open}/{capacity} logfile handles open. Hits: '
+                           '{hits}, misses: {misses}, evictions: {evictions}.'
+                           .format(**stats))
+
+    @logset.command(name='rotate')
+    async def set_rotate(self, mode: str = None):
+        """Sets logfile rotation: off, daily, or a size in MB.
+
+        Closed segments are compressed in the background. Logs fetched into a
+        subfolder are never rotated."""
+        if mode is not None:
+            mode = mode.lower()
+            if mode == 'off':
+                self.settings.pop('rotate', None)
+            elif mode == 'daily':
+                self.settings['rotate'] = mode
+            elif mode.isdigit() and int(mode) > 0:
+                self.settings['rotate'] = int(mode)
+            else:
+                await self.bot.say('Rotation must be off, daily or a size in MB.')
+                return
+            self.save_json()
+
+        rotate = self.settings.get('rotate')
+        if rotate == 'daily':
+            await self.bot.say('Logfiles are rotated daily.')
+        elif rotate:
+            await self.bot.say('Logfiles are rotated every %iMB.' % rotate)
+        else:
+            await self.bot.say('Logfile rotation is disabled.')
+
+    @logset.command(pass_context=True, name='format')
+    async def set_format(self, ctx, fmt: str = None):
+        """Sets the log format for this server: text or jsonl.
+
+        In a DM, sets the default for direct messages and unset servers.
+        jsonl logs are written to <channel>.jsonl, one JSON object per line.
+        Old text logs can be converted with logconvert.py from the cog repo."""
+        server = ctx.message.server
+
+        if fmt is not None:
+            fmt = fmt.lower()
+            if fmt not in LOG_FORMATS:
+                await self.bot.say('Format must be one of: %s.'
+                                   % ', '.join(LOG_FORMATS))
+                return
+
+            if server is None:
+                self.settings['format'] = fmt
+            else:
+                if server.id not in self.settings:
+                    self.settings[server.id] = {}
+                self.settings[server.id]['format'] = fmt
+
+            self.save_json()
+
+        if server is None:
+            fmt = self.settings.get('format', 'text')
+            await self.bot.say('The default log format is %s.' % fmt)
+        else:
+            fmt = self.get_format(server)
+            await self.bot.say('The log format for %s is %s.' % (server, fmt))
+
+    @logset.command(name='index')
+    async def set_index(self, on_off: bool = None):
+        """Index logged entries for logsearch? Uses additional disk space."""
+        if on_off is not None:
+            self.settings['index'] = on_off
+            self.save_json()
+            await self.writer_call(self.writer.set_index, on_off)
+
+        if self.index:
+            await self.bot.say('Search indexing is enabled.')
+        else:
+            await self.bot.say('Search indexing is disabled.')
+
     def save_json(self):
+        self.decisions.clear()  # settings changed, recompute on demand
         dataIO.save_json(JSON, self.settings)
 
     @staticmethod
@@ -481,39 +1722,16 @@ class ActivityLogger(object):
         elif before:
             return target_str + ' removed (was %i, %i)' % tuple(bpair)
 
-    def gethandle(self, path, mode='a'):
-        """Manages logfile handles, culling stale ones and creating folders"""
-        if path in self.handles:
-            if os.path.exists(path):
-                return self.handles[path]
-            else:  # file was deleted?
-                try:  # try to close, no guarantees tho
-                    self.handles[path].close()
-                except Exception:
-                    pass
-                del self.handles[path]
-                return self.gethandle(path, mode)
-        else:
-            # Clean up excess handles before creating a new one
-            if len(self.handles) >= 256:
-                chrono = sorted(self.handles.items(), key=lambda x: x[1].time)
-                oldest_path, oldest_handle = chrono[0]
-                oldest_handle.close()
-                del self.handles[oldest_path]
-
-            dirname, _ = os.path.split(path)
-
-            try:
-                if not os.path.exists(dirname):
-                    os.makedirs(dirname)
-                handle = LogHandle(path, mode=mode)
-            except Exception:
-                raise
-
-            self.handles[path] = handle
-            return handle
-
     def should_log(self, location):
+        """Memoized logging decision for a location, see _should_log"""
+        key = (type(location), getattr(location, 'id', None))
+        try:
+            return self.decisions[key]
+        except KeyError:
+            result = self.decisions[key] = self._should_log(location)
+            return result
+
+    def _should_log(self, location):
         if self.settings.get('everything', False):
             return True
 
@@ -541,14 +1759,18 @@ class ActivityLogger(object):
             return False
 
     def should_download(self, msg):
-        return self.should_log(msg.channel) and \
-            self.settings.get('attachments', False)
-
-    def process_attachment(self, message):
-        a = message.attachments[0]
-        aid = a['id']
-        aname = a['filename']
-        url = a['url']
+        channel = msg.channel
+        key = ('download', getattr(channel, 'id', None))
+        try:
+            return self.decisions[key]
+        except KeyError:
+            result = self.should_log(channel) and \
+                self.settings.get('attachments', False)
+            self.decisions[key] = result
+            return result
+
+    def process_attachments(self, message):
+        """Returns (id, url, path, filename, truncated) for each attachment"""
         channel = message.channel
         path = PATH_LIST.copy()
 
@@ -559,99 +1781,205 @@ class ActivityLogger(object):
 
         path += [serverid, channel.id + '_attachments']
         path = os.path.join(*path)
-        filename = aid + '_' + aname
-
-        if len(filename) > 255:
-            target_len = 255 - len(aid) - 4
-            part_a = target_len // 2
-            part_b = target_len - part_a
-            filename = aid + '_' + aname[:part_a] + '...' + aname[-part_b:]
-            truncated = True
-        else:
-            truncated = False
+        results = []
+
+        for a in message.attachments:
+            aid = a['id']
+            aname = a['filename']
+            filename = aid + '_' + aname
+
+            if len(filename) > 255:
+                target_len = 255 - len(aid) - 4
+                part_a = target_len // 2
+                part_b = target_len - part_a
+                filename = aid + '_' + aname[:part_a] + '...' + aname[-part_b:]
+                truncated = True
+            else:
+                truncated = False
 
-        return aid, url, path, filename, truncated
+            results.append((aid, a['url'], path, filename, truncated))
 
-    async def log(self, location, text, timestamp=None, force=False, subfolder=None, mode='a'):
-        if not timestamp:
-            timestamp = datetime.utcnow()
-        if self.lock or not (force or self.should_log(location)):
-            return
+        return results
 
+    @staticmethod
+    def get_path(location, subfolder=None, ext='.log'):
+        """Returns the logfile path for a location, or None if unsupported"""
         path = PATH_LIST.copy()
-        entry = [timestamp.strftime(TIMESTAMP_FORMAT)]
 
         if type(location) is discord.Server:
-            path += [location.id, 'server.log']
+            path += [location.id, 'server' + ext]
         elif type(location) is discord.Channel:
-            serverid = location.server.id
-            entry.append('#' + location.name)
-            path += [serverid, location.id + '.log']
+            path += [location.server.id, location.id + ext]
         elif type(location) is discord.PrivateChannel:
-            path += ['direct', location.id + '.log']
+            path += ['direct', location.id + ext]
         else:
-            return
+            return None
 
         if subfolder:
             path.insert(-1, str(subfolder))
 
-        text = text.replace('\n', '\\n')
-        entry.append(text)
+        return os.path.join(*path)
+
+    @staticmethod
+    def location_ids(location):
+        """Returns (server id, channel id or None) for a log location"""
+        if type(location) is discord.Server:
+            return location.id, None
+        elif type(location) is discord.Channel:
+            return location.server.id, location.id
+        else:
+            return 'direct', location.id
+
+    def get_format(self, location):
+        """Memoized output format for a location, 'text' or 'jsonl'"""
+        serverid, _ = self.location_ids(location)
+        key = ('format', serverid)
+        try:
+            return self.decisions[key]
+        except KeyError:
+            fmt = self.settings.get('format', 'text')
+
+            # DMs use the top-level format; settings['direct'] is logset dm's bool
+            server_settings = self.settings.get(serverid)
+            if serverid != 'direct' and isinstance(server_settings, dict):
+                fmt = server_settings.get('format', fmt)
+
+            self.decisions[key] = fmt
+            return fmt
+
+    def log_path(self, location, subfolder=None):
+        """Returns the logfile path for a location in its output format"""
+        ext = LOG_FORMATS[self.get_format(location)]
+        return self.get_path(location, subfolder, ext)
+
+    async def log(self, location, text, *args, **kwargs):
+        """Queues an entry for the writer thread. See log_many."""
+        await self.log_many(location, (text,), *args, **kwargs)
+
+    async def log_many(self, location, entries, timestamp=None, force=False, subfolder=None,
+                       mode='a', author=None, event=None, fields=None, template_args=None):
+        """Queues several entries for one location as a single write.
+
+        If template_args is given, each entry is formatted with them in the
+        writer thread, so they must be copied values such as strings, never
+        discord objects that may change before the entry is written.
+        """
+        if not entries:
+            return
+        if not timestamp:
+            timestamp = datetime.utcnow()
+        if self.lock or not (force or self.should_log(location)):
+            return
+
+        if type(location) not in (discord.Server, discord.Channel, discord.PrivateChannel):
+            return
+
+        jsonl = self.get_format(location) == 'jsonl'
+        fname = self.get_path(location, subfolder, '.jsonl' if jsonl else '.log')
+        channel_name = location.name if type(location) is discord.Channel else None
 
-        fname = os.path.join(*path)
-        handle = self.gethandle(fname, mode=mode)
-        await handle.write(' '.join(entry) + '\n')
+        args = (fname, mode, timestamp, entries, template_args,
+                self.location_ids(location), channel_name, author, event,
+                fields, subfolder, jsonl)
+        await self.submit((self.writer.write_entries, args, None))
 
     async def message_handler(self, message, *args, force_attachments=None, **kwargs):
         dl_attachment = self.should_download(message)
         if force_attachments is not None:
             dl_attachment = force_attachments
 
+        author, content = self.author_name(message), message.clean_content
+
         if message.attachments and dl_attachment:
-            aid, url, path, filename, trunc = self.process_attachment(message)
-            entry = DOWNLOAD_TEMPLATE.format(message, filename)
-            if trunc:
+            attachments = self.process_attachments(message)
+            filenames = ', '.join(a[3] for a in attachments)
+
+            if len(attachments) > 1:
+                entry = MULTI_DOWNLOAD_TEMPLATE
+            else:
+                entry = DOWNLOAD_TEMPLATE
+
+            if any(a[4] for a in attachments):
                 entry += ' (filename truncated)'
+
+            template_args = (author, content, filenames)
         elif message.attachments:
             urls = ','.join(a['url'] for a in message.attachments)
-            entry = ATTACHMENT_TEMPLATE.format(message, urls)
+            entry = ATTACHMENT_TEMPLATE
+            template_args = (author, content, urls)
         else:
-            entry = MESSAGE_TEMPLATE.format(message)
-
-        await self.log(message.channel, entry, message.timestamp, *args, **kwargs)
+            entry = MESSAGE_TEMPLATE
+            template_args = (author, content)
+
+        fields = None
+        if self.get_format(message.channel) == 'jsonl':
+            fields = self.message_fields(message, content=False)
+            fields['content'] = content
+            if message.attachments and dl_attachment:
+                fields['files'] = [a[3] for a in attachments]
+            elif message.attachments:
+                fields['attachments'] = [a['url'] for a in message.attachments]
+
+        await self.log(message.channel, entry, message.timestamp, *args,
+                       author=message.author.id, event='message',
+                       fields=fields, template_args=template_args, **kwargs)
 
         if message.attachments and dl_attachment:
-            dl_path = os.path.join(path, filename)
-            tmp_path = os.path.join(path, aid + '.tmp')
-            if not os.path.exists(path):
-                os.mkdir(path)
+            for aid, url, path, filename, _ in attachments:
+                self.downloads.put(aid, url, os.path.join(path, filename))
+
+    @staticmethod
+    def author_name(message):
+        return '%s#%s' % (message.author.name, message.author.discriminator)
+
+    @classmethod
+    def message_fields(cls, message, content=True):
+        """Structured fields describing a message, for jsonl output"""
+        fields = {
+            'message_id'  : message.id,
+            'author_name' : cls.author_name(message),
+            'message_ts'  : message.timestamp.replace(tzinfo=timezone.utc).timestamp()
+        }
+
+        if content:
+            fields['content'] = message.clean_content
 
-            if not os.path.exists(dl_path):  # don't redownload
-                async with self.session.get(url) as r:
-                    with open(tmp_path, 'wb') as f:
-                        f.write(await r.read())
-                    os.rename(tmp_path, dl_path)
+        return fields
 
     async def on_message(self, message):
         await self.message_handler(message)
 
     async def on_message_edit(self, before, after):
-        timestamp = before.timestamp.strftime(TIMESTAMP_FORMAT)
-        entry = EDIT_TEMPLATE.format(before, after, timestamp)
-        await self.log(after.channel, entry, after.edited_timestamp)
+        before_content, after_content = before.clean_content, after.clean_content
+
+        fields = None
+        if self.get_format(after.channel) == 'jsonl':
+            fields = self.message_fields(after, content=False)
+            fields['before'] = before_content
+            fields['after'] = after_content
+
+        await self.log(after.channel, EDIT_TEMPLATE, after.edited_timestamp,
+                       author=after.author.id, event='edit', fields=fields,
+                       template_args=(self.author_name(after), before_content,
+                                      after_content, before.timestamp))
 
     async def on_message_delete(self, message):
-        timestamp = message.timestamp.strftime(TIMESTAMP_FORMAT)
-        entry = DELETE_TEMPLATE.format(message, timestamp)
-        await self.log(message.channel, entry)
+        fields = None
+        if self.get_format(message.channel) == 'jsonl':
+            fields = self.message_fields(message)
+
+        await self.log(message.channel, DELETE_TEMPLATE, author=message.author.id,
+                       event='delete', fields=fields,
+                       template_args=(self.author_name(message), message.clean_content,
+                                      message.timestamp))
 
     async def on_server_join(self, server):
         entry = 'this bot joined the server'
-        await self.log(server, entry)
+        await self.log(server, entry, event='server_join')
 
     async def on_server_remove(self, server):
         entry = 'this bot left the server'
-        await self.log(server, entry)
+        await self.log(server, entry, event='server_leave')
 
     async def on_server_update(self, before, after):
         entries = []
@@ -667,16 +1995,17 @@ class ActivityLogger(object):
         if before.icon_url != after.icon_url:
             entries.append('Server icon changed from %s to %s' %
                            (before.icon_url, after.icon_url))
-        for e in entries:
-            await self.log(before, e)
+        await self.log_many(before, entries, event='server_update')
 
     async def on_server_role_create(self, role):
         entry = "Role created: '%s' (id %s)" % (role, role.id)
-        await self.log(role.server, entry)
+        await self.log(role.server, entry, event='role_create',
+                       fields={'role': role.id})
 
     async def on_server_role_delete(self, role):
         entry = "Role deleted: '%s' (id %s)" % (role, role.id)
-        await self.log(role.server, entry)
+        await self.log(role.server, entry, event='role_delete',
+                       fields={'role': role.id})
 
     async def on_server_role_update(self, before, after):
         if not self.should_log(before.server):
@@ -706,24 +2035,24 @@ class ActivityLogger(object):
         if before.position != after.position:
             entries.append("Role position: '{0}' changed from "
                            "{0.position} to {1.position}".format(before, after))
-        for e in entries:
-            await self.log(before.server, e)
+        await self.log_many(before.server, entries, event='role_update',
+                            fields={'role': before.id})
 
     async def on_member_join(self, member):
         entry = 'Member join: @{0} (id {0.id})'.format(member)
-        await self.log(member.server, entry)
+        await self.log(member.server, entry, author=member.id, event='member_join')
 
     async def on_member_remove(self, member):
         entry = 'Member leave: @{0} (id {0.id})'.format(member)
-        await self.log(member.server, entry)
+        await self.log(member.server, entry, author=member.id, event='member_leave')
 
     async def on_member_ban(self, member):
         entry = 'Member ban: @{0} (id {0.id})'.format(member)
-        await self.log(member.server, entry)
+        await self.log(member.server, entry, author=member.id, event='member_ban')
 
     async def on_member_unban(self, server, user):
         entry = 'Member unban: @{0} (id {0.id})'.format(user)
-        await self.log(server, entry)
+        await self.log(server, entry, author=user.id, event='member_unban')
 
     async def on_member_update(self, before, after):
         if not self.should_log(before.server):
@@ -745,20 +2074,22 @@ class ActivityLogger(object):
                 entries.append("Member role add: '%s' role was added to @%s" % (r, after))
             for r in removed:
                 entries.append("Member role remove: The '%s' role was removed from @%s" % (r, after))
-        for e in entries:
-            await self.log(before.server, e)
+        await self.log_many(before.server, entries, author=before.id,
+                            event='member_update')
 
     async def on_channel_create(self, channel):
         if channel.is_private:
             return
         entry = 'Channel created: %s' % channel
-        await self.log(channel.server, entry)
+        await self.log(channel.server, entry, event='channel_create',
+                       fields={'target_channel': channel.id})
 
     async def on_channel_delete(self, channel):
         if channel.is_private:
             return
         entry = 'Channel deleted: %s' % channel
-        await self.log(channel.server, entry)
+        await self.log(channel.server, entry, event='channel_delete',
+                       fields={'target_channel': channel.id})
 
     async def on_channel_update(self, before, after):
         if type(before) is discord.PrivateChannel:
@@ -799,8 +2130,8 @@ class ActivityLogger(object):
                                                  before_overwrites[isect_ow],
                                                  after_overwrites[isect_ow]))
 
-        for e in entries:
-            await self.log(before.server, e)
+        await self.log_many(before.server, entries, event='channel_update',
+                            fields={'target_channel': before.id})
 
     async def on_voice_state_update(self, before, after):
         if not self.should_log(before.server):
@@ -812,7 +2143,8 @@ class ActivityLogger(object):
                 if after.voice_channel:
                     msg += ' moving to {1.voice_channel}'
 
-                await self.log(before.voice_channel, msg.format(before, after))
+                await self.log(before.voice_channel, msg.format(before, after),
+                               author=before.id, event='voice_leave')
 
             if after.voice_channel:
                 msg = "Voice channel join: {0} (id {0.id})"
@@ -823,27 +2155,32 @@ class ActivityLogger(object):
                 if flags:
                     msg += ', flags: %s' % ','.join(flags)
 
-                await self.log(after.voice_channel, msg.format(before, after))
+                await self.log(after.voice_channel, msg.format(before, after),
+                               author=after.id, event='voice_join')
 
         if before.deaf != after.deaf:
             verb = 'deafen' if after.deaf else 'undeafen'
             await self.log(before.voice_channel,
-                           'Server {0}: {1} (id {1.id})'.format(verb, before))
+                           'Server {0}: {1} (id {1.id})'.format(verb, before),
+                           author=before.id, event='voice_state')
 
         if before.mute != after.mute:
             verb = 'mute' if after.mute else 'unmute'
             await self.log(before.voice_channel,
-                           'Server {0}: {1} (id {1.id})'.format(verb, before))
+                           'Server {0}: {1} (id {1.id})'.format(verb, before),
+                           author=before.id, event='voice_state')
 
         if before.self_deaf != after.self_deaf:
             verb = 'deafen' if after.self_deaf else 'undeafen'
             await self.log(before.voice_channel,
-                           'Server self-{0}: {1} (id {1.id})'.format(verb, before))
+                           'Server self-{0}: {1} (id {1.id})'.format(verb, before),
+                           author=before.id, event='voice_state')
 
         if before.self_mute != after.self_mute:
             verb = 'mute' if after.self_mute else 'unmute'
             await self.log(before.voice_channel,
-                           'Server self-{0}: {1} (id {1.id})'.format(verb, before))
+                           'Server self-{0}: {1} (id {1.id})'.format(verb, before),
+                           author=before.id, event='voice_state')
 
 
 def check_folders():
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Offline benchmark for activitylog's event handling hot paths.
+
+Run it from the root folder of a Red install, so that discord.py and
+cogs.utils can be imported:
+
+    python path/to/activitylog/benchmark.py [--events N] [--scenario NAME]
+
+The cog is loaded from this folder, and its discord global is swapped for
+lightweight stand-ins, so no token or connection is needed. Logs are written
+to a temporary folder that is deleted afterwards.
+
+For each scenario, this reports events/sec (including the time the writer
+thread takes to drain), p50/p99 handler latency, and the read/write syscalls
+made during the run. Syscall counts come from /proc/self/io, so they are only
+shown on Linux.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.getcwd())
+
+import discord  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EPOCH = datetime(2018, 1, 1)
+
+
+class FakeServer:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class FakeChannel:
+    is_private = False
+
+    def __init__(self, id, name, server, type=discord.ChannelType.text):
+        self.id = id
+        self.name = name
+        self.server = server
+        self.type = type
+        self.created_at = EPOCH
+
+    def __str__(self):
+        return self.name
+
+
+class FakePrivateChannel:
+    is_private = True
+
+    def __init__(self, id, user):
+        self.id = id
+        self.user = user
+
+
+class FakeMember:
+    def __init__(self, id, name, server, voice_channel=None, **flags):
+        self.id = id
+        self.name = name
+        self.discriminator = '%04i' % (int(id) % 10000)
+        self.server = server
+        self.nick = None
+        self.roles = []
+        self.voice_channel = voice_channel
+        self.deaf = flags.get('deaf', False)
+        self.mute = flags.get('mute', False)
+        self.self_deaf = flags.get('self_deaf', False)
+        self.self_mute = flags.get('self_mute', False)
+
+    def __str__(self):
+        return '%s#%s' % (self.name, self.discriminator)
+
+
+class FakeMessage:
+    def __init__(self, id, channel, author, content, timestamp, attachments=()):
+        self.id = id
+        self.channel = channel
+        self.author = author
+        self.content = self.clean_content = content
+        self.timestamp = timestamp
+        self.edited_timestamp = None
+        self.attachments = list(attachments)
+
+
+class FakeDiscord:
+    """Stands in for the discord module, with the fakes in place of models"""
+    Server = FakeServer
+    Channel = FakeChannel
+    PrivateChannel = FakePrivateChannel
+    Member = FakeMember
+    Message = FakeMessage
+
+    def __getattr__(self, name):
+        return getattr(discord, name)
+
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+        self.cogs = {}
+
+
+def load_cog():
+    spec = importlib.util.spec_from_file_location('activitylog',
+                                                  os.path.join(HERE, 'activitylog.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.discord = FakeDiscord()
+    return module
+
+
+def read_syscalls():
+    """Returns (read, write) syscalls made by this process so far, or None"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['syscr']), int(counters['syscw'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def make_world(channels, members=100):
+    server = FakeServer('1000', 'bench')
+    text = [FakeChannel(str(2000 + i), 'text-%i' % i, server) for i in range(channels)]
+    voice = [FakeChannel(str(900000 + i), 'voice %i' % i, server, discord.ChannelType.voice)
+             for i in range(max(1, channels // 10))]
+    people = [FakeMember(str(500000 + i), 'user%i' % i, server) for i in range(members)]
+    return server, text, voice, people
+
+
+def message_events(cog, n, channels):
+    server, text, _, people = make_world(channels)
+    for i in range(n):
+        msg = FakeMessage(str(i), text[i % len(text)], people[i % len(people)],
+                          'benchmark message %i\nwith a second line' % i,
+                          EPOCH + timedelta(seconds=i))
+        yield cog.on_message, (msg,)
+
+
+def edit_events(cog, n, channels):
+    server, text, _, people = make_world(channels)
+    for i in range(n):
+        channel = text[i % len(text)]
+        author = people[i % len(people)]
+        timestamp = EPOCH + timedelta(seconds=i)
+        before = FakeMessage(str(i), channel, author, 'before %i' % i, timestamp)
+        after = FakeMessage(str(i), channel, author, 'after %i' % i, timestamp)
+        after.edited_timestamp = timestamp + timedelta(seconds=5)
+        yield cog.on_message_edit, (before, after)
+
+
+def voice_events(cog, n, channels):
+    server, _, voice, people = make_world(channels)
+    state = {m.id: m for m in people}
+    rng = random.Random(0)  # seeded, so every run replays the same changes
+
+    for i in range(n):
+        before = state[rng.choice(people).id]
+        after = FakeMember(before.id, before.name, server, before.voice_channel,
+                           self_mute=before.self_mute)
+
+        # either move to another channel or toggle self-mute
+        if rng.random() < 0.5 or before.voice_channel is None:
+            others = [c for c in voice if c is not before.voice_channel]
+            after.voice_channel = rng.choice(others or voice)
+        else:
+            after.self_mute = not before.self_mute
+
+        state[after.id] = after
+        yield cog.on_voice_state_update, (before, after)
+
+
+SCENARIOS = {
+    # name: (event generator, channels, settings)
+    'messages'  : (message_events, 50, {}),
+    'jsonl'     : (message_events, 50, {'format': 'jsonl'}),
+    'edits'     : (edit_events, 50, {}),
+    'voice'     : (voice_events, 50, {}),
+    'eviction'  : (message_events, 5000, {'handle_limit': 256}),
+    'indexed'   : (message_events, 50, {'index': True}),
+}
+
+
+async def run_scenario(module, loop, n, events, channels, settings):
+    shutil.rmtree(module.PATH, ignore_errors=True)
+    module.check_folders()
+    module.check_files()
+
+    cog = module.ActivityLogger(FakeBot(loop))
+    cog.settings.update(settings, everything=True)
+    cog.handles.set_capacity(settings.get('handle_limit', module.HANDLE_LIMIT))
+    if settings.get('index'):
+        await cog.writer_call(cog.writer.set_index, True)
+
+    latencies = []
+    syscalls = read_syscalls()
+    start = time.perf_counter()
+
+    try:
+        for handler, args in events(cog, n, channels):
+            t0 = time.perf_counter()
+            await handler(*args)
+            latencies.append(time.perf_counter() - t0)
+
+        await cog.writer_call(cog.writer.flush_all)
+        elapsed = time.perf_counter() - start
+        after = read_syscalls()
+        stats = cog.get_stats()
+    finally:
+        cog._ActivityLogger__unload()
+
+    if syscalls and after:
+        syscalls = tuple(b - a for a, b in zip(syscalls, after))
+    else:
+        syscalls = None
+
+    return {
+        'events'    : len(latencies),
+        'rate'      : len(latencies) / elapsed,
+        'p50'       : percentile(latencies, 0.50) * 1e6,
+        'p99'       : percentile(latencies, 0.99) * 1e6,
+        'syscalls'  : syscalls,
+        'written'   : stats['written'],
+        'evictions' : stats['handles_evictions']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark activitylog event handling.')
+    parser.add_argument('--events', type=int, default=20000,
+                        help='events per scenario (default: %(default)s)')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, may be repeated (default: all)')
+    args = parser.parse_args(argv)
+
+    module = load_cog()
+    loop = asyncio.get_event_loop()
+    workdir = tempfile.mkdtemp(prefix='activitylog-bench-')
+    os.chdir(workdir)
+    os.makedirs('data')
+
+    header = '%-10s %8s %8s %10s %9s %9s %9s %9s %9s'
+    print(header % ('scenario', 'events', 'entries', 'events/s', 'p50 us',
+                    'p99 us', 'syscr', 'syscw', 'evicted'))
+
+    try:
+        for name in args.scenario or sorted(SCENARIOS):
+            events, channels, settings = SCENARIOS[name]
+            result = loop.run_until_complete(run_scenario(module, loop, args.events, events,
+                                                          channels, settings))
+            syscr, syscw = result['syscalls'] or ('-', '-')
+            print('%-10s %8i %8i %10.0f %9.1f %9.1f %9s %9s %9i' % (
+                name, result['events'], result['written'], result['rate'], result['p50'],
+                result['p99'], syscr, syscw, result['evictions']))
+    finally:
+        os.chdir(HERE)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
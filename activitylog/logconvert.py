@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Offline converter from activitylog text logs to the jsonl format.
+
+Usage: python logconvert.py [--force] PATH [PATH ...]
+
+Each PATH is a .log file (optionally a compressed .log.gz/.log.zst segment)
+or a folder, which is searched recursively. Output is written next to each
+input as .jsonl, one JSON object per line, using the same field names as the
+cog's jsonl mode. Fields that the text format never recorded (such as author
+and message IDs) are left out.
+
+Note that the text format escapes newlines as \\n without escaping
+backslashes, so a literal "\\n" in a message is converted to a newline.
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %X'
+JSON_ENCODE = json.JSONEncoder(ensure_ascii=False, check_circular=False,
+                               separators=(',', ':')).encode
+
+LINE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) (.*)$')
+
+# Voice channel names may contain spaces, so try the known voice entries first
+VOICE_CHANNEL_RE = re.compile(r'^#(.*?) ((?:Voice channel (?:join|leave)|'
+                              r'Server (?:self-)?\w+): .*)$')
+CHANNEL_RE = re.compile(r'^#(\S*) (.*)$')
+
+AUTHOR = r'^@(?P<author_name>[^#]+#\d{4})'
+TS = r'(?P<message_ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})'
+
+# (event, regex) pairs, tried in order
+PATTERNS = [(event, re.compile(regex)) for event, regex in (
+    ('message', AUTHOR + r': (?P<content>.*) \(attachments? saved to '
+                         r'(?P<files>.*?)\)(?: \(filename truncated\))?$'),
+    ('message', AUTHOR + r': (?P<content>.*) \(attachment url\(s\): '
+                         r'(?P<attachments>.*)\)$'),
+    ('edit', AUTHOR + r' edited message from ' + TS +
+             r' \((?P<before>.*?)\) to read: (?P<after>.*)$'),
+    ('delete', AUTHOR + r' deleted message from ' + TS + r' \((?P<content>.*)\)$'),
+    ('message', AUTHOR + r': (?P<content>.*)$'),
+    ('voice_join', r'^Voice channel join: .* \(id (?P<author>\d+)\)'),
+    ('voice_leave', r'^Voice channel leave: .* \(id (?P<author>\d+)\)'),
+    ('voice_state', r'^Server (?:self-)?\w+: .* \(id (?P<author>\d+)\)$'),
+    ('member_join', r'^Member join: .* \(id (?P<author>\d+)\)$'),
+    ('member_leave', r'^Member leave: .* \(id (?P<author>\d+)\)$'),
+    ('member_ban', r'^Member ban: .* \(id (?P<author>\d+)\)$'),
+    ('member_unban', r'^Member unban: .* \(id (?P<author>\d+)\)$'),
+    ('member_update', r"^Member (?:nickname|username): '.*' \(id (?P<author>\d+)\)"),
+    ('member_update', r'^Member role (?:add|remove): '),
+    ('role_create', r"^Role created: '.*' \(id (?P<role>\d+)\)$"),
+    ('role_delete', r"^Role deleted: '.*' \(id (?P<role>\d+)\)$"),
+    ('role_update', r'^Role \w+: '),
+    ('channel_create', r'^Channel created: '),
+    ('channel_delete', r'^Channel deleted: '),
+    ('channel_update', r'^Channel (?:rename|topic|position|overwrites): '),
+    ('server_update', r'^Server \w+ changed from '),
+    ('server_join', r'^this bot joined the server$'),
+    ('server_leave', r'^this bot left the server$'),
+)]
+
+
+def unescape(text):
+    return text.replace('\\n', '\n')
+
+
+def to_epoch(timestamp):
+    ts = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    return ts.replace(tzinfo=timezone.utc).timestamp()
+
+
+def describe_path(path):
+    """Returns (server, channel or None) from a log's location on disk"""
+    folder, fname = os.path.split(os.path.abspath(path))
+    stem = fname.split('.', 1)[0]
+    server = os.path.basename(folder)
+
+    # fetched logs live in data/activitylogger/<server>/<subfolder>/
+    if not (server.isdigit() or server == 'direct'):
+        parent = os.path.basename(os.path.dirname(folder))
+        if parent.isdigit() or parent == 'direct':
+            server = parent
+
+    return server, None if stem == 'server' else stem
+
+
+def convert_line(line, server, channel):
+    match = LINE_RE.match(line.rstrip('\n'))
+    if not match:
+        return None
+
+    timestamp, rest = match.groups()
+    record = {'ts': to_epoch(timestamp), 'event': 'event', 'server': server}
+
+    if channel:
+        record['channel'] = channel
+        match = VOICE_CHANNEL_RE.match(rest) or CHANNEL_RE.match(rest)
+        if match:
+            record['channel_name'], rest = match.groups()
+
+    for event, regex in PATTERNS:
+        match = regex.match(rest)
+        if not match:
+            continue
+
+        record['event'] = event
+        for k, v in match.groupdict().items():
+            if v is None:
+                continue
+            elif k == 'message_ts':
+                record[k] = to_epoch(v)
+            elif k == 'files':
+                record[k] = v.split(', ')
+            elif k == 'attachments':
+                record[k] = v.split(',')
+            elif k in ('content', 'before', 'after'):
+                record[k] = unescape(v)
+            else:
+                record[k] = v
+        break
+
+    record['text'] = unescape(rest)
+    return record
+
+
+def open_log(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', errors='backslashreplace')
+    elif path.endswith('.zst'):
+        if not zstandard:
+            raise RuntimeError('the zstandard package is needed to read %s' % path)
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(raw, errors='backslashreplace')
+    else:
+        return open(path, errors='backslashreplace')
+
+
+def output_path(path):
+    for ext in ('.log.gz', '.log.zst', '.log'):
+        if path.endswith(ext):
+            return path[:-len(ext)] + '.jsonl'
+
+
+def convert_file(path, force=False):
+    dest = output_path(path)
+    if os.path.exists(dest) and not force:
+        print('Skipping %s: %s exists' % (path, dest), file=sys.stderr)
+        return 0
+
+    server, channel = describe_path(path)
+    count = 0
+
+    with open_log(path) as src, open(dest + '.tmp', 'w') as dst:
+        for line in src:
+            record = convert_line(line, server, channel)
+            if record is not None:
+                dst.write(JSON_ENCODE(record) + '\n')
+                count += 1
+
+    os.replace(dest + '.tmp', dest)
+    return count
+
+
+def find_logs(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for fname in sorted(files):
+                    if output_path(fname):
+                        yield os.path.join(root, fname)
+        else:
+            yield path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert activitylog text '
+                                                 'logs to jsonl.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='log files, or folders to search for them')
+    parser.add_argument('--force', action='store_true',
+                        help='overwrite existing .jsonl files')
+    args = parser.parse_args(argv)
+
+    for path in find_logs(args.paths):
+        count = convert_file(path, force=args.force)
+        print('%s: %i entries' % (path, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -48,6 +48,8 @@ class DataDog:
         self.send_voice()
         self.send_players()
         self.send_uptime()
+        self.send_activitylog()
+        self.send_scheduler()
 
     def send_uptime(self):
         if not self.tags:
@@ -102,6 +104,29 @@ class DataDog:
         statsd.gauge('bot.voice_playing', num_avcs, tags=self.tags)
         statsd.gauge('bot.voice_audience', audience, tags=self.tags)
 
+    def send_activitylog(self):
+        if not self.tags:
+            return
+        cog = self.bot.get_cog('ActivityLogger')
+        if not hasattr(cog, 'get_stats'):
+            return
+        for k, v in cog.get_stats().items():
+            statsd.gauge('bot.activitylog.' + k, v, tags=self.tags)
+
+    def send_scheduler(self):
+        if not self.tags:
+            return
+        cog = self.bot.get_cog('Scheduler')
+        if not hasattr(cog, 'get_metrics'):
+            return
+        metrics = cog.get_metrics()
+        for label, count in metrics.pop('lateness').items():
+            statsd.gauge('bot.scheduler.lateness', count,
+                         tags=[*self.tags, 'bucket:' + label])
+        for k, v in metrics.items():
+            if not isinstance(v, dict):
+                statsd.gauge('bot.scheduler.' + k, v, tags=self.tags)
+
     async def loop_task(self):
         await self.bot.wait_until_ready()
         self.tags = ['application:red',
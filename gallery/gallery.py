@@ -4,6 +4,7 @@ import discord
 import logging
 import os
 import re
+from functools import lru_cache
 from time import time
 from discord.ext import commands
 from cogs.utils.dataIO import dataIO
@@ -26,6 +27,14 @@ UNIT_TABLE = (
     (('seconds', 'secs', 's'), 1),
 )
 
+# every prefix of every unit name, mapped to the first unit it could mean
+UNIT_PREFIXES = {name[:i]: (names, length) for names, length in reversed(UNIT_TABLE)
+                 for name in names for i in range(1, len(name) + 1)}
+
+TIME_SPLIT_RE = re.compile(r'\s*([\d.]+\s*[^\d\s,;]*)(?:[,;\s]|and)*')
+TIMESPEC_RE = re.compile(r'([\d.]+)\s*([^\d\s]*)')
+TIME_CACHE_SIZE = 256
+
 DEFAULTS = {
     'ENABLED'     : False,
     'ARTIST_ROLE' : 'artist',
@@ -50,22 +59,23 @@ class BadTimeExpr(ValueError):
 
 
 def _find_unit(unit):
-    for names, length in UNIT_TABLE:
-        if any(n.startswith(unit) for n in names):
-            return names, length
-    raise BadTimeExpr("Invalid unit: %s" % unit)
+    try:
+        return UNIT_PREFIXES[unit]
+    except KeyError:
+        raise BadTimeExpr("Invalid unit: %s" % unit) from None
 
 
+@lru_cache(maxsize=TIME_CACHE_SIZE)
 def _parse_time(time):
     time = time.lower()
     if not time.isdigit():
-        time = re.split(r'\s*([\d.]+\s*[^\d\s,;]*)(?:[,;\s]|and)*', time)
+        time = TIME_SPLIT_RE.split(time)
         time = sum(map(_timespec_sec, filter(None, time)))
     return int(time)
 
 
 def _timespec_sec(expr):
-    atoms = re.split(r'([\d.]+)\s*([^\d\s]*)', expr)
+    atoms = TIMESPEC_RE.split(expr)
     atoms = list(filter(None, atoms))
 
     if len(atoms) > 2:  # This shouldn't ever happen
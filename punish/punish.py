@@ -7,6 +7,7 @@ from cogs.utils.dataIO import dataIO
 import os
 import time
 import re
+from functools import lru_cache
 
 __version__ = '1.8.2'
 
@@ -31,28 +32,37 @@ UNIT_TABLE = (
     (('seconds', 'secs', 's'), 1),
 )
 
+# every prefix of every unit name, mapped to the first unit it could mean
+UNIT_PREFIXES = {name[:i]: (names, length) for names, length in reversed(UNIT_TABLE)
+                 for name in names for i in range(1, len(name) + 1)}
+
+TIME_SPLIT_RE = re.compile(r'\s*([\d.]+\s*[^\d\s,;]*)(?:[,;\s]|and)*')
+TIMESPEC_RE = re.compile(r'([\d.]+)\s*([^\d\s]*)')
+TIME_CACHE_SIZE = 256
+
 
 class BadTimeExpr(Exception):
     pass
 
 
 def _find_unit(unit):
-    for names, length in UNIT_TABLE:
-        if any(n.startswith(unit) for n in names):
-            return names, length
-    raise BadTimeExpr("Invalid unit: %s" % unit)
+    try:
+        return UNIT_PREFIXES[unit]
+    except KeyError:
+        raise BadTimeExpr("Invalid unit: %s" % unit) from None
 
 
+@lru_cache(maxsize=TIME_CACHE_SIZE)
 def _parse_time(time):
     time = time.lower()
     if not time.isdigit():
-        time = re.split(r'\s*([\d.]+\s*[^\d\s,;]*)(?:[,;\s]|and)*', time)
+        time = TIME_SPLIT_RE.split(time)
         time = sum(map(_timespec_sec, filter(None, time)))
     return int(time)
 
 
 def _timespec_sec(expr):
-    atoms = re.split(r'([\d.]+)\s*([^\d\s]*)', expr)
+    atoms = TIMESPEC_RE.split(expr)
     atoms = list(filter(None, atoms))
 
     if len(atoms) > 2:  # This shouldn't ever happen
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Compares the scheduler's timer engines on synthetic oneshot workloads.
+
+Run it from the root folder of a Red install, so that discord.py and
+cogs.utils can be imported:
+
+    python path/to/scheduler/benchmark.py [--sizes 10000,100000,1000000]
+
+For each size and engine, this pushes that many oneshots due between one
+minute and six hours out, cancels a tenth of them, then advances a simulated
+clock one second at a time until every event has fired. It prints the time
+per push and cancel, and the event rate while draining.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HORIZON = 6 * 60 * 60
+
+
+def load_cog():
+    spec = importlib.util.spec_from_file_location('scheduler',
+                                                  os.path.join(HERE, 'scheduler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_events(module, n, start, seed=0):
+    rng = random.Random(seed)
+    events = []
+
+    for i in range(n):
+        event = module.Event(name='bench-%i' % i, channel='2', server=str(i % 100),
+                             author='3', command='ping', timedelta=60, repeat=False)
+        events.append((start + rng.uniform(60, HORIZON), event))
+
+    return events
+
+
+def run_engine(engine, events, start, cancel_every=10):
+    queue = engine()
+
+    t0 = time.perf_counter()
+    for when, event in events:
+        queue.push(when, event)
+    push_time = time.perf_counter() - t0
+
+    cancelled = events[::cancel_every]
+    t0 = time.perf_counter()
+    for _, event in cancelled:
+        queue.cancel(queue.key(event))
+    cancel_time = time.perf_counter() - t0
+
+    fired = 0
+    now = start
+    t0 = time.perf_counter()
+    while now < start + HORIZON + 1:
+        now += 1
+        fired += len(queue.pop_due(now))
+    drain_time = time.perf_counter() - t0
+
+    assert fired == len(events) - len(cancelled), fired
+    return {
+        'push'   : push_time / len(events) * 1e6,
+        'cancel' : cancel_time / len(cancelled) * 1e6,
+        'drain'  : fired / drain_time
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark scheduler timer engines.')
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma-separated event counts (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    module = load_cog()
+    start = int(time.time())
+
+    print('%-8s %9s %10s %10s %12s' % ('engine', 'events', 'push us',
+                                       'cancel us', 'drain ev/s'))
+
+    for n in map(int, args.sizes.split(',')):
+        events = make_events(module, n, start)
+
+        for name, engine in sorted(module.ENGINES.items()):
+            result = run_engine(engine, events, start)
+            print('%-8s %9i %10.2f %10.2f %12.0f' % (name, n, result['push'],
+                                                     result['cancel'], result['drain']))
+
+
+if __name__ == '__main__':
+    main()
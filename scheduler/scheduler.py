@@ -4,23 +4,56 @@ from cogs.utils import checks
 from cogs.utils.dataIO import dataIO
 from cogs.utils.chat_formatting import box, error, warning
 
+import heapq
+import itertools
+import json
 import logging
 import os
 import re
 import asyncio
+import bisect
 import time
+from collections import Counter, OrderedDict, defaultdict, deque
 from datetime import datetime, timezone, timedelta
-from random import randint
+from random import randint, uniform
+from functools import lru_cache
 from math import ceil
-from collections import defaultdict
 
-__version__ = '2.0.1'
+__version__ = '2.1.0'
 
 log = logging.getLogger("red.scheduler")
 log.setLevel(logging.INFO)
 
 PATH = 'data/scheduler/'
 JSON = PATH + 'events.json'
+JOURNAL = PATH + 'events.journal'
+SETTINGS = PATH + 'settings.json'
+
+# journal records written before they are folded into events.json
+COMPACT_RECORDS = 1000
+
+# longest the queue manager sleeps before re-checking the wall clock
+MAX_SLEEP = 3600
+
+# events further out than this wait in the cold tier; must exceed MAX_SLEEP
+COLD_HORIZON = 24 * 60 * 60
+PROMOTE_BATCH = 1000
+
+# default dispatch limits: (commands, per seconds), and max random delay
+CHANNEL_RATE = (5, 5)
+GLOBAL_RATE = (25, 1)
+DISPATCH_JITTER = 0
+
+# upper bounds, in seconds, of the firing lateness histogram buckets
+LATENESS_BUCKETS = (0.5, 1, 5, 30, 60, 300, 3600)
+
+LIST_PAGE_SIZE = 10
+
+# What to do with runs missed while the bot was down; see [p]scheduler catchup
+CATCHUP_DEFAULTS = {True: 'skip', False: 'once'}  # by repeat
+REPLAY_LIMIT = 25  # most missed runs replayed per event with 'all'
+CATCHUP_KEEP = {'skip': 0, 'once': 1, 'all': REPLAY_LIMIT}
+REPLAY_RATE = (1, 3)
 
 UNIT_TABLE = (
     (('weeks', 'wks', 'w'), 60 * 60 * 24 * 7),
@@ -30,6 +63,14 @@ UNIT_TABLE = (
     (('seconds', 'secs', 's'), 1),
 )
 
+# every prefix of every unit name, mapped to the first unit it could mean
+UNIT_PREFIXES = {name[:i]: (names, length) for names, length in reversed(UNIT_TABLE)
+                 for name in names for i in range(1, len(name) + 1)}
+
+TIME_SPLIT_RE = re.compile(r'\s*([\d.]+\s*[^\d\s,;]*)(?:[,;\s]|and)*')
+TIMESPEC_RE = re.compile(r'([\d.]+)\s*([^\d\s]*)')
+TIME_CACHE_SIZE = 256
+
 
 class Event:
     __slots__ = ['name', 'channel', 'server', 'author', 'command',
@@ -61,27 +102,465 @@ class Event:
         return True
 
 
+class TimerHeap:
+    """Min-heap of (time, event) entries, keyed by (server, name).
+
+    Cancelled entries stay in the heap as tombstones and are skipped when they
+    reach the top, so pushing and cancelling are both O(log n). The heap is
+    rebuilt when tombstones outnumber live entries.
+    """
+    COMPACT_MIN = 64
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}  # key: [time, seq, event, live]
+        self.counter = itertools.count()
+        self.tombstones = 0
+
+    @staticmethod
+    def key(event):
+        return (event.server, event.name)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def push(self, when, event):
+        """Schedules event at when, replacing any entry with the same key"""
+        key = self.key(event)
+        self.cancel(key)
+        entry = [when, next(self.counter), event, True]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+
+    def cancel(self, key):
+        """Removes the entry for key, returning its (time, event) or None"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+
+        entry[3] = False
+        self.tombstones += 1
+
+        if self.tombstones > max(len(self.entries), self.COMPACT_MIN):
+            self.compact()
+
+        return entry[0], entry[2]
+
+    def compact(self):
+        self.heap = [e for e in self.heap if e[3]]
+        heapq.heapify(self.heap)
+        self.tombstones = 0
+
+    def _prune(self):
+        while self.heap and not self.heap[0][3]:
+            heapq.heappop(self.heap)
+            self.tombstones -= 1
+
+    def peek(self):
+        """Returns the earliest (time, event), or None if empty"""
+        self._prune()
+        if self.heap:
+            return self.heap[0][0], self.heap[0][2]
+
+    def pop(self):
+        """Removes and returns the earliest (time, event)"""
+        self._prune()
+        when, _, event, _ = heapq.heappop(self.heap)
+        del self.entries[self.key(event)]
+        return when, event
+
+    def load(self, items):
+        """Adds many (time, event) pairs with a single heapify"""
+        for when, event in items:
+            key = self.key(event)
+            old = self.entries.get(key)
+            if old is not None:
+                old[3] = False
+                self.tombstones += 1
+
+            entry = [when, next(self.counter), event, True]
+            self.entries[key] = entry
+            self.heap.append(entry)
+
+        heapq.heapify(self.heap)
+
+    def pop_due(self, now, limit=None):
+        """Removes and returns (time, event) pairs due by now, in order"""
+        due = []
+        self._prune()
+
+        while self.heap and self.heap[0][0] <= now and len(due) != limit:
+            due.append(self.pop())
+            self._prune()
+
+        return due
+
+    def next_deadline(self):
+        head = self.peek()
+        return head and head[0]
+
+    def when(self, key):
+        """Returns the time queued for key, or None"""
+        entry = self.entries.get(key)
+        return entry and entry[0]
+
+    def items(self):
+        return [(e[0], e[2]) for e in self.entries.values()]
+
+    def clear(self):
+        self.heap.clear()
+        self.entries.clear()
+        self.tombstones = 0
+
+    def stats(self):
+        return {'live': len(self.entries), 'tombstones': self.tombstones}
+
+
+class TimingWheel:
+    """Hierarchical timing wheel with one-second ticks.
+
+    Level n has 64 slots, each 64**n seconds wide. An entry goes on the lowest
+    level that spans the distance to its tick, and moves down a level when the
+    wheel reaches its slot. Push, cancel and expiry are O(1) for each level,
+    at the cost of stepping through every second up to now in pop_due.
+    Same interface as TimerHeap.
+    """
+    BITS = 6
+    LEVELS = 6  # 2**36 seconds before entries wrap around the top level
+    MASK = (1 << BITS) - 1
+
+    key = staticmethod(TimerHeap.key)
+
+    def __init__(self, now=None):
+        self.now = int(time.time() if now is None else now)
+        self.slots = [[{} for _ in range(1 << self.BITS)] for _ in range(self.LEVELS)]
+        self.ready = {}
+        self.entries = {}  # key: [time, seq, event, tick, slot dict]
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def push(self, when, event):
+        """Schedules event at when, replacing any entry with the same key"""
+        key = self.key(event)
+        self.cancel(key)
+
+        if not self.entries:  # skip the idle time instead of ticking through it
+            self.now = max(self.now, int(time.time()))
+
+        entry = [when, next(self.counter), event, int(ceil(when)), None]
+        self.entries[key] = entry
+        self._place(key, entry)
+
+    def _place(self, key, entry):
+        tick = entry[3]
+
+        if tick <= self.now:
+            slot = self.ready
+        else:
+            level = min(((tick ^ self.now).bit_length() - 1) // self.BITS,
+                        self.LEVELS - 1)
+            slot = self.slots[level][(tick >> (self.BITS * level)) & self.MASK]
+
+        slot[key] = entry
+        entry[4] = slot
+
+    def cancel(self, key):
+        """Removes the entry for key, returning its (time, event) or None"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+
+        del entry[4][key]
+        return entry[0], entry[2]
+
+    def _tick(self):
+        now = self.now
+
+        # cascade the slots that start now, highest level first
+        if not now & self.MASK:
+            for level in range(self.LEVELS - 1, 0, -1):
+                if now & ((1 << (self.BITS * level)) - 1):
+                    continue
+
+                slot = self.slots[level][(now >> (self.BITS * level)) & self.MASK]
+                if slot:
+                    entries = list(slot.items())
+                    slot.clear()
+                    for key, entry in entries:
+                        self._place(key, entry)
+
+        slot = self.slots[0][now & self.MASK]
+        if slot:
+            for entry in slot.values():
+                entry[4] = self.ready
+            self.ready.update(slot)
+            slot.clear()
+
+    def load(self, items):
+        for when, event in items:
+            self.push(when, event)
+
+    def pop_due(self, now):
+        """Advances the wheel, returning every (time, event) due by now"""
+        target = int(now)
+
+        if len(self.ready) == len(self.entries):  # nothing left in the wheel
+            self.now = max(self.now, target)
+
+        while self.now < target:
+            self.now += 1
+            self._tick()
+
+        due = [(k, e) for k, e in self.ready.items() if e[0] <= now]
+        due.sort(key=lambda i: (i[1][0], i[1][1]))
+
+        for key, _ in due:
+            del self.ready[key]
+            del self.entries[key]
+
+        return [(e[0], e[2]) for _, e in due]
+
+    def next_deadline(self):
+        """Returns the earliest due time among ready entries, or the start of
+        the next occupied slot, whichever is sooner. None if empty."""
+        deadline = min((e[0] for e in self.ready.values()), default=None)
+
+        if len(self.ready) == len(self.entries):
+            return deadline
+
+        for level, slots in enumerate(self.slots):
+            low = (1 << (self.BITS * level)) - 1
+            for slot in slots:
+                if slot:
+                    start = next(iter(slot.values()))[3] & ~low
+                    if deadline is None or start < deadline:
+                        deadline = start
+
+        return deadline
+
+    def when(self, key):
+        """Returns the time queued for key, or None"""
+        entry = self.entries.get(key)
+        return entry and entry[0]
+
+    def items(self):
+        return [(e[0], e[2]) for e in self.entries.values()]
+
+    def clear(self):
+        for level in self.slots:
+            for slot in level:
+                slot.clear()
+        self.ready.clear()
+        self.entries.clear()
+
+    def stats(self):
+        return {'live': len(self.entries), 'tombstones': 0}
+
+
+ENGINES = {
+    'heap'  : TimerHeap,
+    'wheel' : TimingWheel
+}
+
+
+class EventJournal:
+    """Append-only record of changes to the events dict.
+
+    Each add, remove, oneshot firing or repeat run is one JSON line in the
+    journal, so saving a change costs O(1). Every COMPACT_RECORDS lines, the whole dict is
+    written to the events.json snapshot and the journal is emptied. Loading
+    replays the journal on top of the snapshot.
+    """
+
+    def __init__(self, snapshot=JSON, path=JOURNAL, compact_every=COMPACT_RECORDS):
+        self.snapshot = snapshot
+        self.path = path
+        self.compact_every = compact_every
+        self.events = None
+        self.handle = None
+        self.records = 0
+
+    def load(self):
+        """Returns the events dict from the snapshot and journal"""
+        self.events = dataIO.load_json(self.snapshot)
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.replay(json.loads(line))
+                    except (ValueError, KeyError):  # cut off by a crash
+                        log.warning('Skipping bad journal record: %r', line)
+
+        self.compact()
+        return self.events
+
+    def replay(self, record):
+        server, name = record['server'], record['name']
+
+        if record['op'] == 'add':
+            self.events.setdefault(server, {})[name] = record['event']
+        elif record['op'] == 'run':
+            event = self.events.get(server, {}).get(name)
+            if event is not None:
+                event['checked'] = record['time']
+        else:
+            self.events.get(server, {}).pop(name, None)
+
+    def append(self, record):
+        if self.handle is None:
+            self.handle = open(self.path, 'a', encoding='utf-8')
+
+        self.handle.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.handle.flush()
+        self.records += 1
+
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def add(self, server, name, event):
+        self.append({'op': 'add', 'server': server, 'name': name, 'event': event})
+
+    def run(self, server, name, when):
+        """Records that a repeating event has run up to when"""
+        self.append({'op': 'run', 'server': server, 'name': name, 'time': when})
+
+    def remove(self, server, name, op='remove'):
+        """Records a removal; op is 'remove', or 'fire' for a finished oneshot"""
+        self.append({'op': op, 'server': server, 'name': name})
+
+    def compact(self):
+        """Writes the snapshot, then empties the journal"""
+        dataIO.save_json(self.snapshot, self.events)
+        self.close()
+        open(self.path, 'w').close()
+        self.records = 0
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class TokenBucket:
+    """Allows rate takes every per seconds, in bursts of up to rate"""
+    __slots__ = ['rate', 'per', 'tokens', 'updated']
+
+    def __init__(self, rate, per, now):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    def delay(self, now):
+        """Returns the seconds until a token is available"""
+        self._refill(now)
+        return max(0, (1 - self.tokens) * self.per / self.rate)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.rate
+
+
+class EventIndex:
+    """Lookups of (server, name) keys by author and by channel.
+
+    The events dict already groups events by server, and the timer engine
+    knows each one's next run, so together these cover listing and filtering
+    without scanning everything.
+    """
+
+    def __init__(self, events=None):
+        self.by_author = defaultdict(set)
+        self.by_channel = defaultdict(set)
+
+        for server, server_events in (events or {}).items():
+            for name, event in server_events.items():
+                self.add(server, name, event)
+
+    def add(self, server, name, event):
+        self.by_author[event['author']].add((server, name))
+        self.by_channel[event['channel']].add((server, name))
+
+    def remove(self, server, name, event):
+        for index, k in ((self.by_author, event['author']),
+                         (self.by_channel, event['channel'])):
+            keys = index.get(k)
+            if keys is not None:
+                keys.discard((server, name))
+                if not keys:
+                    del index[k]
+
+
+class SchedulerMetrics:
+    """Counters for how well the scheduler is keeping up"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.lateness = [0] * (len(LATENESS_BUCKETS) + 1)
+        self.lateness_total = 0
+        self.lateness_max = 0
+        self.fired = 0
+        self.fired_by_server = Counter()
+        self.missing_channel = 0
+        self.added = 0
+        self.cancelled = 0
+        self.requeued = 0
+        self.replayed = 0
+        self.missed_skipped = 0
+
+    def record_fire(self, event, lateness):
+        lateness = max(lateness, 0)
+        self.lateness[bisect.bisect_left(LATENESS_BUCKETS, lateness)] += 1
+        self.lateness_total += lateness
+        self.lateness_max = max(self.lateness_max, lateness)
+        self.fired += 1
+        self.fired_by_server[event.server] += 1
+
+    def histogram(self):
+        labels = ['<=%gs' % b for b in LATENESS_BUCKETS]
+        labels.append('>%gs' % LATENESS_BUCKETS[-1])
+        return OrderedDict(zip(labels, self.lateness))
+
+
 class BadTimeExpr(ValueError):
     pass
 
 
 def _find_unit(unit):
-    for names, length in UNIT_TABLE:
-        if any(n.startswith(unit) for n in names):
-            return names, length
-    raise BadTimeExpr("Invalid unit: %s" % unit)
+    try:
+        return UNIT_PREFIXES[unit]
+    except KeyError:
+        raise BadTimeExpr("Invalid unit: %s" % unit) from None
 
 
+@lru_cache(maxsize=TIME_CACHE_SIZE)
 def _parse_time(time):
     time = time.lower()
     if not time.isdigit():
-        time = re.split(r'\s*([\d.]+\s*[^\d\s,;]*)(?:[,;\s]|and)*', time)
+        time = TIME_SPLIT_RE.split(time)
         time = sum(map(_timespec_sec, filter(None, time)))
     return int(time)
 
 
 def _timespec_sec(expr):
-    atoms = re.split(r'([\d.]+)\s*([^\d\s]*)', expr)
+    atoms = TIMESPEC_RE.split(expr)
     atoms = list(filter(None, atoms))
 
     if len(atoms) > 2:  # This shouldn't ever happen
@@ -147,42 +626,136 @@ class Scheduler:
 
     def __init__(self, bot):
         self.bot = bot
-        self.events = dataIO.load_json(JSON)
-        self.queue = asyncio.PriorityQueue(loop=self.bot.loop)
+        self.journal = EventJournal()
+        self.events = self.journal.load()
+        self.index = EventIndex(self.events)
+        self.settings = dataIO.load_json(SETTINGS)
+        self.queue = ENGINES[self.settings.get('engine', 'heap')]()
+        self.cold = TimerHeap()
         self.queue_lock = asyncio.Lock()
-        self.pending = {}
-        self.pending_by_event = defaultdict(lambda: list())
+        self.wakeup = asyncio.Event(loop=self.bot.loop)
+        self.dispatch_queues = OrderedDict()  # channel id: [(ready, seq, event, time, replay)]
+        self.dispatch_counter = itertools.count()
+        self._reset_buckets()
+        self.metrics = SchedulerMetrics()
+        self.replay_queue = deque()  # (scheduled time, event), oldest first
         self._load_events()
         self.task = bot.loop.create_task(self.queue_manager())
 
     def __unload(self):
         self.task.cancel()
+        self.save_events()
 
     def save_events(self):
-        dataIO.save_json(JSON, self.events)
+        """Writes all events to events.json. Single changes go to the journal."""
+        self.journal.compact()
 
     def _load_events(self):
-        # for entry in the self.events make an Event
+        """Builds the hot and cold queues from the stored events in one pass.
+
+        Runs missed while the bot was down are kept or dropped according to
+        each event's catch-up policy, and the kept ones go to the replay queue.
+        A missed oneshot stays stored, so it can be cancelled, until it is
+        replayed.
+        """
+        now = int(time.time())
+        hot, cold, replays, fired = [], [], [], []
+
         for server in self.events:
             for name, event in self.events[server].items():
                 e = Event(server=server, **event)
-                self.bot.loop.create_task(self._put_event(e))
+                keep = CATCHUP_KEEP[self.catchup_policy(event)]
+                missed, kept = self._missed_runs(e, event.get('checked', now), now, keep)
+
+                if missed:
+                    replays.extend((t, e) for t in kept)
+                    self.metrics.missed_skipped += missed - len(kept)
+
+                    if not e.repeat:
+                        if not kept:
+                            fired.append((server, name))
+                        continue
+
+                    # with replays pending, each one marks its run when sent
+                    if not kept:
+                        event['checked'] = now
+                        self.journal.run(server, name, now)
+
+                fut = self._next_time(e, now)
+                (cold if fut - now > COLD_HORIZON else hot).append((fut, e))
+
+        for server, name in fired:
+            self._forget_event(server, name, op='fire')
+
+        self.queue.load(hot)
+        self.cold.load(cold)
+
+        replays.sort(key=lambda r: r[0])
+        self.replay_queue.extend(replays)
+
+        if replays:
+            log.info('Replaying {} runs missed while offline'.format(len(replays)))
+
+    @staticmethod
+    def catchup_policy(event):
+        return event.get('catchup', CATCHUP_DEFAULTS[bool(event['repeat'])])
+
+    @staticmethod
+    def _missed_runs(event, checked, now, keep):
+        """Counts the runs event missed after checked and before now.
+
+        Returns the count, and the times of the last keep of those runs.
+        """
+        if not event.repeat:
+            due = Scheduler._next_time(event, now)
+            missed = [due] if due < now else []
+            return len(missed), missed[:keep]
+
+        td = event.timedelta
+        if checked < event.starttime:
+            first = event.starttime
+        else:
+            first = event.starttime + ((checked - event.starttime) // td + 1) * td
+
+        count = max(ceil((now - first) / td), 0)
+        return count, [first + k * td for k in range(max(count - keep, 0), count)]
+
+    @staticmethod
+    def _next_time(event, now):
+        if event.repeat:
+            diff = max(now - event.starttime, 0)
+            return (ceil(diff / event.timedelta) * event.timedelta) + event.starttime
+        else:
+            return (event.starttime or now) + event.timedelta
 
     async def _put_event(self, event, fut=None, offset=None):
-        if fut is None:
-            now = int(time.time())
+        now = int(time.time())
 
-            if event.repeat:
-                diff = max(now - event.starttime, 0)
-                fut = ((ceil(diff / event.timedelta) * event.timedelta) +
-                       event.starttime)
-            else:
-                fut = now + event.timedelta
+        if fut is None:
+            fut = self._next_time(event, now)
 
         if offset:
             fut += offset
 
-        await self.queue.put((fut, event))
+        key = TimerHeap.key(event)
+        wake = self.next_wake()
+
+        if fut - now > COLD_HORIZON:
+            self.queue.cancel(key)
+            self.cold.push(fut, event)
+            log.debug('Added "{}" to the cold queue at {}'.format(event.name, fut))
+
+            # the manager must be awake to promote it once it's within range
+            if wake is None or fut - COLD_HORIZON < wake:
+                self.wakeup.set()
+            return
+
+        self.cold.cancel(key)
+        self.queue.push(fut, event)
+
+        # the manager is sleeping until the old deadline; wake it to re-plan
+        if wake is None or fut < wake:
+            self.wakeup.set()
 
         log.debug('Added "{}" to the scheduler queue at {}'.format(event.name,
                                                                    fut))
@@ -211,44 +784,61 @@ class Scheduler:
             'command'   : command,
             'timedelta' : timedelta,
             'repeat'    : repeat,
-            'starttime' : start or int(time.time())
+            'starttime' : start or int(time.time()),
+            'checked'   : int(time.time())
         }
 
         log.debug('event dict:\n\t{}'.format(event_dict))
 
         self.events[dest_server][name] = event_dict
+        self.index.add(dest_server, name, event_dict)
         e = Event(server=dest_server, **event_dict)
         await self._put_event(e)
 
-        self.save_events()
+        self.journal.add(dest_server, name, event_dict)
+        self.metrics.added += 1
 
-    async def _remove_event(self, name, server):
-        events = []
-        removed = None
+    def _forget_event(self, server, name, op='remove'):
+        """Drops a stored event and records it, returning its dict or None"""
+        event = self.events.get(server, {}).pop(name, None)
+
+        if event is not None:
+            self.index.remove(server, name, event)
+            self.journal.remove(server, name, op=op)
 
+        return event
+
+    async def _remove_event(self, name, server):
+        """Cancels queued runs of an event, including missed runs waiting to be
+        replayed and due ones waiting to be dispatched. Returns a cancelled
+        (time, event), or None."""
         async with self.queue_lock:
+            key = (server.id, name)
+            removed = self.queue.cancel(key) or self.cold.cancel(key)
 
-            while not self.queue.empty():
-                time, event = self.queue.get_nowait()
-                if name == event.name and server.id == event.server:
-                    removed = (time, event)
-                    break
-                else:
-                    events.append((time, event))
+            for channel_id, queue in list(self.dispatch_queues.items()):
+                kept, dropped = [], []
+                for d in queue:
+                    (dropped if TimerHeap.key(d[2]) == key else kept).append(d)
 
-            for event in events:
-                self.queue.put_nowait(event)
+                if not dropped:
+                    continue
+                elif not removed:
+                    removed = dropped[0][3], dropped[0][2]
 
-        if not removed:
-            return None
+                if kept:
+                    self.dispatch_queues[channel_id] = kept
+                else:
+                    del self.dispatch_queues[channel_id]
 
-        time, event = removed
-        if self.pending_by_event[event]:
-            for ts in self.pending_by_event[event]:
-                k = (ts, event)
-                self.pending[k].cancel()
-                del self.pending[k]
-            del self.pending_by_event[event]
+            replays = [r for r in self.replay_queue if TimerHeap.key(r[1]) == key]
+            if replays:
+                removed = removed or replays[0]
+                self.replay_queue = deque(r for r in self.replay_queue
+                                          if TimerHeap.key(r[1]) != key)
+
+        if removed:
+            self.metrics.cancelled += 1
 
         return removed
 
@@ -407,27 +997,53 @@ class Scheduler:
         server = ctx.message.server
         name = name.lower()
 
-        if not self.events.get(server.id):
-            await self.bot.say('No events are scheduled for this server.')
+        event = self._forget_event(server.id, name)
+        removed = await self._remove_event(name, server)
+
+        if not (event or removed):
+            await self.bot.say('There is no event named "{}".'.format(name))
             return
 
-        del self.events[server.id][name]
-        await self._remove_event(name, server)
-        self.save_events()
         await self.bot.say('"{}" has successfully been removed.'.format(name))
 
+    @scheduler.command(pass_context=True, name="catchup")
+    @checks.mod_or_permissions(manage_messages=True)
+    async def _scheduler_catchup(self, ctx, name, policy: str = None):
+        """Shows or sets what an event does about runs missed while the bot was down.
+
+        skip: drop them, and wait for the next run (default for repeats)
+        once: run once for all of them (default for oneshots)
+        all: run each of them, up to 25, spaced out by the replay rate
+        """
+        server = ctx.message.server
+        name = name.lower()
+        event = self.events.get(server.id, {}).get(name)
+
+        if event is None:
+            await self.bot.say('There is no event named "{}".'.format(name))
+            return
+        elif policy is None:
+            await self.bot.say('"{}" catches up with: {}.'.format(name, self.catchup_policy(event)))
+            return
+
+        policy = policy.lower()
+        if policy not in CATCHUP_KEEP:
+            await self.bot.say(error('Policy must be one of: skip, once, all.'))
+            return
+
+        event['catchup'] = policy
+        self.journal.add(server.id, name, event)
+        await self.bot.say('"{}" now catches up with: {}.'.format(name, policy))
+
     @scheduler.command(pass_context=True, name="cancel")
     async def _scheduler_cancel(self, ctx, *, command):
         """Cancels a scheduled oneshot (non-repeating) command."""
         server = ctx.message.server
         fname = ctx.message.author.id + '-' + command.lower()
 
-        event = self.events.get(server.id, {}).pop(fname, None)
+        event = self._forget_event(server.id, fname)
         cancelled = await self._remove_event(fname, server)
 
-        if event:
-            self.save_events()
-
         if event or cancelled:
             await self.bot.say('"{}" has been successfully cancelled.'.format(command))
         else:
@@ -435,18 +1051,278 @@ class Scheduler:
 
     @scheduler.command(pass_context=True, name="list")
     @checks.mod_or_permissions(manage_messages=True)
-    async def _scheduler_list(self, ctx):
-        """Lists all repeated commands
+    async def _scheduler_list(self, ctx, *filters):
+        """Lists scheduled commands, soonest first.
+
+        Filters can be any of: @member, #channel, repeat, oneshot, or a page
+        number. For example: [p]scheduler list #general repeat 2
         """
         server = ctx.message.server
+        server_events = self.events.get(server.id)
 
-        if not self.events.get(server.id):
+        if not server_events:
             await self.bot.say('No events scheduled for this server.')
             return
 
-        mess = "Names:\n\t"
-        mess += "\n\t".join(sorted(self.events[server.id].keys()))
-        await self.bot.say(box(mess))
+        keys = None
+        kind = None
+        page = 1
+
+        for f in filters:
+            match = re.match(r'<(@!?|#)(\d+)>$', f)
+            if match:
+                sigil, target = match.groups()
+                index = self.index.by_channel if sigil == '#' else self.index.by_author
+                found = index.get(target, set())
+                keys = found if keys is None else keys & found
+            elif f.lower() in ('repeat', 'oneshot'):
+                kind = f.lower() == 'repeat'
+            elif f.isdigit() and int(f) > 0:
+                page = int(f)
+            else:
+                await self.bot.say(error('Unknown filter: %s' % f))
+                return
+
+        if keys is None:
+            names = list(server_events)
+        else:
+            names = [name for sid, name in keys if sid == server.id]
+
+        if kind is not None:
+            names = [n for n in names if bool(server_events[n]['repeat']) is kind]
+
+        if not names:
+            await self.bot.say('No matching events.')
+            return
+
+        upcoming = [(self.next_run((server.id, n)), n) for n in names]
+        upcoming.sort(key=lambda i: (i[0] is None, i[0] or 0, i[1]))
+
+        pages = ceil(len(upcoming) / LIST_PAGE_SIZE)
+        page = min(page, pages)
+        start = (page - 1) * LIST_PAGE_SIZE
+        now = time.time()
+        lines = []
+
+        for when, name in upcoming[start:start + LIST_PAGE_SIZE]:
+            event = server_events[name]
+            channel = self.bot.get_channel(event['channel'])
+            member = server.get_member(event['author'])
+
+            if when is None:
+                next_run = 'due now'
+            elif when - now < 1:
+                next_run = 'next: now'
+            else:
+                next_run = 'next: in ' + _generate_timespec(round(when - now), micro=True)
+
+            if event['repeat']:
+                every = 'every ' + _generate_timespec(event['timedelta'], micro=True)
+            else:
+                every = 'once'
+
+            command = event['command']
+            if len(command) > 40:
+                command = command[:37] + '...'
+
+            lines.append('%s (%s, %s)\n  #%s by %s: %s' % (
+                name, next_run, every, channel or event['channel'],
+                member or event['author'], command))
+
+        lines.append('Page %i of %i, %i events' % (page, pages, len(upcoming)))
+        await self.bot.say(box('\n'.join(lines)))
+
+    def next_run(self, key):
+        """Returns when the event with key is next queued to run, or None"""
+        when = self.queue.when(key)
+        return self.cold.when(key) if when is None else when
+
+    @scheduler.command(pass_context=True, name="engine")
+    @checks.is_owner()
+    async def _scheduler_engine(self, ctx, engine: str = None):
+        """Shows or sets the timer engine, heap or wheel.
+
+        The heap is the faster engine for most bots. In benchmarks, the timing
+        wheel only fired events faster with around a million oneshots queued,
+        and was slower to add and cancel them.
+        """
+        current = self.settings.get('engine', 'heap')
+
+        if engine is None:
+            await self.bot.say('The scheduler is using the %s engine.' % current)
+            return
+
+        engine = engine.lower()
+        if engine not in ENGINES:
+            await self.bot.say(error('Engine must be one of: %s.'
+                                     % ', '.join(sorted(ENGINES))))
+            return
+
+        async with self.queue_lock:
+            old, self.queue = self.queue, ENGINES[engine]()
+            for when, event in old.items():
+                self.queue.push(when, event)
+
+        self.settings['engine'] = engine
+        dataIO.save_json(SETTINGS, self.settings)
+        self.wakeup.set()
+
+        await self.bot.say('The scheduler now uses the %s engine.' % engine)
+
+    @scheduler.command(pass_context=True, name="dispatch")
+    @checks.is_owner()
+    async def _scheduler_dispatch(self, ctx, setting: str = None, *values: float):
+        """Shows or changes how fast scheduled commands are dispatched.
+
+        channel <rate> <per>: at most <rate> runs every <per> seconds in a channel
+        global <rate> <per>: the same limit, across all channels
+        jitter <seconds>: delays each run by a random time up to this long
+        replay <rate> <per>: the limit for runs missed while the bot was down
+        """
+        if setting is not None:
+            setting = setting.lower()
+            arity = {'channel': 2, 'global': 2, 'jitter': 1, 'replay': 2}
+
+            if setting not in arity:
+                await self.bot.say(error('Setting must be channel, global, jitter or replay.'))
+                return
+            elif len(values) != arity[setting] or min(values) < 0 or \
+                    (arity[setting] == 2 and not all(values)):
+                await self.bot.say(error('Invalid values for %s.' % setting))
+                return
+
+            if setting == 'jitter':
+                self.settings['jitter'] = values[0]
+            else:
+                self.settings[setting + '_rate'] = list(values)
+
+            dataIO.save_json(SETTINGS, self.settings)
+            self._reset_buckets()
+
+        channel_rate = self.settings.get('channel_rate', CHANNEL_RATE)
+        global_rate = self.settings.get('global_rate', GLOBAL_RATE)
+        jitter = self.settings.get('jitter', DISPATCH_JITTER)
+        replay_rate = self.settings.get('replay_rate', REPLAY_RATE)
+
+        await self.bot.say(box('Per channel : %g every %gs\n'
+                               'Global      : %g every %gs\n'
+                               'Jitter      : up to %gs\n'
+                               'Replays     : %g every %gs'
+                               % (tuple(channel_rate) + tuple(global_rate) + (jitter,)
+                                  + tuple(replay_rate))))
+
+    def _reset_buckets(self):
+        now = time.monotonic()
+        self.channel_buckets = {}
+        self.global_bucket = TokenBucket(*self.settings.get('global_rate', GLOBAL_RATE),
+                                         now=now)
+        self.replay_bucket = TokenBucket(*self.settings.get('replay_rate', REPLAY_RATE),
+                                         now=now)
+
+    def queue_dispatch(self, event, schedtime, replay=False):
+        """Adds a due event to its channel's dispatch queue, with jitter"""
+        jitter = self.settings.get('jitter', DISPATCH_JITTER)
+        ready = time.monotonic() + (uniform(0, jitter) if jitter else 0)
+        queue = self.dispatch_queues.setdefault(event.channel, [])
+        bisect.insort(queue, (ready, next(self.dispatch_counter), event, schedtime, replay))
+
+    def run_dispatches(self):
+        """Runs queued events as far as the rate limits allow.
+
+        Returns the seconds until the next one could run, or None if none are
+        waiting. Channels take turns, so one busy channel can't starve others.
+        """
+        now = time.monotonic()
+        channel_rate = self.settings.get('channel_rate', CHANNEL_RATE)
+        wait = None
+
+        for channel_id in list(self.dispatch_queues):
+            queue = self.dispatch_queues[channel_id]
+            bucket = self.channel_buckets.get(channel_id)
+
+            if bucket is None:
+                bucket = self.channel_buckets[channel_id] = TokenBucket(*channel_rate, now=now)
+
+            while queue:
+                ready, _, event, schedtime, replay = queue[0]
+                delay = max(ready - now, bucket.delay(now), self.global_bucket.delay(now))
+
+                if delay > 0:
+                    wait = delay if wait is None else min(wait, delay)
+                    break
+
+                bucket.take(now)
+                self.global_bucket.take(now)
+                del queue[0]
+                self.run_coro(event, schedtime, replay)
+
+            if queue:
+                self.dispatch_queues.move_to_end(channel_id)
+            else:
+                del self.dispatch_queues[channel_id]
+
+        for channel_id, bucket in list(self.channel_buckets.items()):
+            if channel_id not in self.dispatch_queues and bucket.full(now):
+                del self.channel_buckets[channel_id]
+
+        return wait
+
+    def get_metrics(self):
+        """Scheduler counters and gauges, for other cogs to poll"""
+        m = self.metrics
+        queue = self.queue.stats()
+        uptime = time.time() - m.started
+
+        return {
+            'events'            : sum(map(len, self.events.values())),
+            'events_by_server'  : {k: len(v) for k, v in self.events.items() if v},
+            'queue_depth'       : queue['live'],
+            'queue_tombstones'  : queue['tombstones'],
+            'cold_depth'        : len(self.cold),
+            'dispatch_backlog'  : sum(map(len, self.dispatch_queues.values())),
+            'fired'             : m.fired,
+            'fired_by_server'   : dict(m.fired_by_server),
+            'fired_per_minute'  : m.fired * 60 / uptime if uptime else 0,
+            'missing_channel'   : m.missing_channel,
+            'added'             : m.added,
+            'cancelled'         : m.cancelled,
+            'requeued'          : m.requeued,
+            'replay_backlog'    : len(self.replay_queue),
+            'replayed'          : m.replayed,
+            'missed_skipped'    : m.missed_skipped,
+            'lateness'          : m.histogram(),
+            'lateness_mean'     : m.lateness_total / m.fired if m.fired else 0,
+            'lateness_max'      : m.lateness_max
+        }
+
+    @scheduler.command(pass_context=True, name="stats")
+    @checks.is_owner()
+    async def _scheduler_stats(self, ctx):
+        """Shows how many events are queued and how late they have run."""
+        metrics = self.get_metrics()
+        server = ctx.message.server
+
+        lines = [
+            'Events     : %i (%i on this server)' % (
+                metrics['events'], metrics['events_by_server'].get(server.id, 0)),
+            'Queued     : %i, %i more over a day out, %i cancelled not yet dropped' % (
+                metrics['queue_depth'], metrics['cold_depth'], metrics['queue_tombstones']),
+            'Dispatching: %i waiting on rate limits' % metrics['dispatch_backlog'],
+            'Catching up: %i missed runs replayed, %i waiting, %i skipped' % (
+                metrics['replayed'], metrics['replay_backlog'], metrics['missed_skipped']),
+            'Fired      : %i (%i on this server), %.2f/min' % (
+                metrics['fired'], metrics['fired_by_server'].get(server.id, 0),
+                metrics['fired_per_minute']),
+            'Churn      : %i added, %i cancelled, %i repeats requeued' % (
+                metrics['added'], metrics['cancelled'], metrics['requeued']),
+            'Lateness   : mean %.2fs, max %.2fs' % (
+                metrics['lateness_mean'], metrics['lateness_max'])
+        ]
+
+        for label, count in metrics['lateness'].items():
+            lines.append('  %-8s %i' % (label, count))
+
+        await self.bot.say(box('\n'.join(lines)))
 
     def dispatch_fake(self, channel, author_id, name, command):
         prefix = self.bot.settings.get_prefixes(channel.server)[0]
@@ -465,49 +1341,99 @@ class Scheduler:
         log.info("Running '{}' in {}".format(name, channel.server))
         self.bot.dispatch('message', fake_message)
 
-    def run_coro(self, event, schedtime):
+    def run_coro(self, event, schedtime, replay=False):
         channel = self.bot.get_channel(event.channel)
 
         if channel is None:
             log.debug("Channel no longer found, not running scheduled event.")
+            self.metrics.missing_channel += 1
         else:
             self.dispatch_fake(channel, event.author, event.name, event.command)
+            if replay:
+                self.metrics.replayed += 1
+            else:
+                self.metrics.record_fire(event, time.time() - schedtime)
 
-        t = (schedtime, event)
-        if t in self.pending:
-            del self.pending[t]
-        self.pending_by_event[event].remove(schedtime)
+        # only recorded now, so runs still waiting on rate limits at unload
+        # are caught up on the next load instead of lost
+        if event.repeat:
+            self._mark_run(event.server, event.name, schedtime)
+        else:
+            stored = self.events.get(event.server, {}).get(event.name)
+            if stored is not None and stored.get('starttime') == event.starttime:
+                self._forget_event(event.server, event.name, op='fire')
 
-    async def process_queue_event(self):
-        if self.queue.empty():
-            return False
+    async def run_due_events(self):
+        """Runs every event that is due.
 
-        now = int(time.time())
-        next_time, next_event = await self.queue.get()
+        Returns the seconds until the next event, or None if none are queued.
+        Cold events coming within COLD_HORIZON are moved to the hot queue first,
+        PROMOTE_BATCH at a time.
+        """
+        now = time.time()
+        promote = self.cold.pop_due(now + COLD_HORIZON, limit=PROMOTE_BATCH)
+        for when, event in promote:
+            self.queue.push(when, event)
 
-        diff = max(next_time - now, 0)
+        while True:
+            due = self.queue.pop_due(time.time())
+            if not due:
+                break
 
-        if diff < 30:
-            log.debug('scheduling call of "{}" in {}s'.format(
-                next_event.name, diff))
+            for next_time, next_event in due:
+                self.queue_dispatch(next_event, next_time)
 
-            fut = self.bot.loop.call_later(diff, self.run_coro,
-                                           next_event, next_time)
-            self.pending[(next_time, next_event)] = fut
-            self.pending_by_event[next_event].append(next_time)
+                if next_event.repeat:
+                    await self._put_event(next_event, next_time,
+                                          next_event.timedelta)
+                    self.metrics.requeued += 1
 
-            if next_event.repeat:
-                await self._put_event(next_event, next_time,
-                                      next_event.timedelta)
-            else:
-                del self.events[next_event.server][next_event.name]
-                self.save_events()
-            return True
-        else:
-            log.debug('Will run {} "{}" in {}s'.format(
-                next_event.name, next_event.command, diff))
-            await self._put_event(next_event, next_time)
-            return False
+        deadline = now if len(promote) == PROMOTE_BATCH else self.next_wake()
+
+        if deadline is not None:
+            return max(deadline - time.time(), 0)
+
+    def next_wake(self):
+        """Returns when the next hot event is due, or the next cold one needs
+        promoting, whichever is sooner. None if both queues are empty."""
+        deadline = self.queue.next_deadline()
+        cold = self.cold.next_deadline()
+
+        if cold is not None and (deadline is None or cold - COLD_HORIZON < deadline):
+            deadline = cold - COLD_HORIZON
+
+        return deadline
+
+    def _mark_run(self, server, name, when):
+        """Records that a repeating event ran at when, for catching up later"""
+        event = self.events.get(server, {}).get(name)
+
+        if event is not None and when > event.get('checked', 0):
+            event['checked'] = when
+            self.journal.run(server, name, when)
+
+    def run_replays(self):
+        """Dispatches runs missed while offline, as fast as the replay rate allows.
+
+        Returns the seconds until the next one can go, or None if none are left.
+        """
+        while self.replay_queue:
+            when, event = self.replay_queue[0]
+
+            # events removed since loading are dropped
+            if event.name not in self.events.get(event.server, {}):
+                self.replay_queue.popleft()
+                continue
+
+            now = time.monotonic()
+            wait = self.replay_bucket.delay(now)
+            if wait:
+                return wait
+
+            self.replay_queue.popleft()
+            self.replay_bucket.take(now)
+            log.info('Replaying "{}" missed at {}'.format(event.name, when))
+            self.queue_dispatch(event, when, replay=True)
 
     async def get_prefix(self, msg, content=None):
         prefixes = self.bot.command_prefix
@@ -528,23 +1454,32 @@ class Scheduler:
             await self.bot.wait_until_ready()
 
             while self == self.bot.get_cog('Scheduler'):
-                while True:
-                    async with self.queue_lock:
-                        if not await self.process_queue_event():
-                            break
+                # cleared first, so events added while running still wake us
+                self.wakeup.clear()
+
+                async with self.queue_lock:
+                    delays = [await self.run_due_events(), self.run_replays(),
+                              self.run_dispatches()]
+
+                delays = [d for d in delays if d is not None]
+                if delays or self.queue or self.cold:
+                    delay = min(delays + [MAX_SLEEP])
+                else:
+                    delay = None
 
-                await asyncio.sleep(5)
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay,
+                                           loop=self.bot.loop)
+                except asyncio.TimeoutError:
+                    pass
 
         except asyncio.CancelledError:
             pass
         finally:
             log.debug('manager dying')
-
-            while not self.queue.empty():
-                await self.queue.get()
-
-            for fut in self.pending.values():
-                fut.cancel()
+            self.queue.clear()
+            self.cold.clear()
+            self.replay_queue.clear()
 
     def _get_start(self, start, now):
         if start.lower() == 'now' or start is None:
@@ -577,6 +1512,10 @@ def check_files():
         print('Creating empty %s' % JSON)
         dataIO.save_json(JSON, {})
 
+    if not dataIO.is_valid_json(SETTINGS):
+        print('Creating default %s' % SETTINGS)
+        dataIO.save_json(SETTINGS, {'engine': 'heap'})
+
 
 def setup(bot):
     check_folder()
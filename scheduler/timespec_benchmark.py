@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for the time expression parser.
+
+Run it from the root folder of a Red install, so that discord.py and
+cogs.utils can be imported:
+
+    python path/to/scheduler/timespec_benchmark.py [--calls N]
+
+The scheduler, punish, gallery and purgepins cogs each carry the same copy of
+_parse_time and friends, so this times the scheduler's. It is compared to the
+previous version, which split with uncompiled patterns and scanned UNIT_TABLE
+for each unit, on a mix of expressions. Both must give the same results.
+"""
+import argparse
+import importlib.util
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+EXPRESSIONS = [
+    '30', '30s', '5m', '90 minutes', '1h30m', '2 hours, 15 mins and 10 secs',
+    '1w 2d 3h 4m 5s', '1.5 days', '3 wks', '12hrs;30mins', '45 seconds',
+    '1 week and 1 day'
+]
+
+
+def load_cog():
+    spec = importlib.util.spec_from_file_location('scheduler',
+                                                  os.path.join(HERE, 'scheduler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_parser(module):
+    """Returns the parser as it was before the lookup table and cache"""
+    def find_unit(unit):
+        for names, length in module.UNIT_TABLE:
+            if any(n.startswith(unit) for n in names):
+                return names, length
+        raise module.BadTimeExpr("Invalid unit: %s" % unit)
+
+    def timespec_sec(expr):
+        atoms = re.split(r'([\d.]+)\s*([^\d\s]*)', expr)
+        atoms = list(filter(None, atoms))
+
+        if len(atoms) > 2:
+            raise module.BadTimeExpr("invalid expression: '%s'" % expr)
+        elif len(atoms) == 2:
+            names, length = find_unit(atoms[1])
+            if atoms[0].count('.') > 1 or \
+                    not atoms[0].replace('.', '').isdigit():
+                raise module.BadTimeExpr("Not a number: '%s'" % atoms[0])
+        else:
+            names, length = find_unit('seconds')
+
+        return float(atoms[0]) * length
+
+    def parse_time(time):
+        time = time.lower()
+        if not time.isdigit():
+            time = re.split(r'\s*([\d.]+\s*[^\d\s,;]*)(?:[,;\s]|and)*', time)
+            time = sum(map(timespec_sec, filter(None, time)))
+        return int(time)
+
+    return parse_time
+
+
+def run(parse, calls):
+    exprs = EXPRESSIONS * (calls // len(EXPRESSIONS) + 1)
+    exprs = exprs[:calls]
+
+    t0 = time.perf_counter()
+    for expr in exprs:
+        parse(expr)
+    return (time.perf_counter() - t0) / calls * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark time expression parsing.')
+    parser.add_argument('--calls', type=int, default=100000,
+                        help='expressions parsed per run (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    module = load_cog()
+    legacy = legacy_parser(module)
+    cached = module._parse_time
+    uncached = cached.__wrapped__
+
+    for expr in EXPRESSIONS:
+        assert legacy(expr) == uncached(expr) == cached(expr), expr
+
+    for bad in ('5 fortnights', '1..5h'):
+        for parse in (legacy, uncached):
+            try:
+                parse(bad)
+            except module.BadTimeExpr:
+                pass
+            else:
+                raise AssertionError(bad)
+
+    print('%-10s %10s' % ('parser', 'us/call'))
+    for name, parse in (('legacy', legacy), ('uncached', uncached), ('cached', cached)):
+        cached.cache_clear()
+        print('%-10s %10.2f' % (name, run(parse, args.calls)))
+
+
+if __name__ == '__main__':
+    main()